@@ -0,0 +1,299 @@
+
+'''
+Headless benchmark suite. Runs Board.find_optimal_computer_turn(),
+Board.generate_score_for_simulation() and Board.check_if_winner_exists() over
+a fixed corpus of positions for every geometry the interface offers (3x3 with
+3 in a row up to the 4x5 and 5x4 boards), and reports latency percentiles,
+fills evaluated per second and peak memory, as JSON.
+
+The corpus is made by seeded random play, so every run measures the same
+positions. Transposition tables and opening books are turned off, so every
+call does the full work.
+
+To run the suite, and to compare a run against an earlier one:
+    python benchmark.py run --output after.json
+    python benchmark.py compare before.json after.json
+compare exits with status 1 if any measurement regressed by more than the
+threshold.
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from dynamic_tictactoe import Board
+from fill_space import count_fills
+from geometry import supported_geometries
+
+FORMAT_VERSION = 1
+DEFAULT_SEED = 2024
+DEFAULT_POSITIONS = 6
+DEFAULT_REPEAT = 3
+#Replays tried per corpus position to find one where the computer's turn
+#needs scoring.
+SCORING_ATTEMPTS = 20
+#check_if_winner_exists() is too quick to time one call at a time.
+WINNER_CHECK_CALLS = 1000
+#Relative slow down past which compare flags a regression.
+DEFAULT_THRESHOLD = 0.15
+
+def geometry_name(num_of_rows, num_of_cols, required_in_a_row):
+    return f'{num_of_rows}x{num_of_cols}_k{required_in_a_row}'
+
+def parse_geometry(text):
+    '''
+    Parses a geometry given as ROWSxCOLSxTO_WIN, such as 4x5x4.
+    '''
+    try:
+        num_of_rows, num_of_cols, required_in_a_row = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{text!r} is not of the form ROWSxCOLSxTO_WIN')
+    return num_of_rows, num_of_cols, required_in_a_row
+
+def make_board(geometry, scorer, workers):
+    num_of_rows, num_of_cols, required_in_a_row = geometry
+    board = Board(required_in_a_row, num_of_rows, num_of_cols, workers=workers, scorer=scorer,
+                  transposition_table=None, opening_book=None)
+    board.show_progress = False
+    return board
+
+def generate_corpus(geometry, num_of_positions, seed=DEFAULT_SEED):
+    '''
+    Returns num_of_positions (x_bits, o_bits) positions for the geometry where
+    it's the computer's turn and the game isn't over, spread from the opening
+    to the end of the game. The same seed always gives the same corpus.
+    '''
+    num_of_rows, num_of_cols, required_in_a_row = geometry
+    rng = random.Random(f'{seed}-{geometry_name(*geometry)}')
+    board = make_board(geometry, 'enumerate', 1)
+    num_of_cells = board.geometry.num_of_cells
+    #Number of turns each competitor has taken, from 1 up to leaving at least
+    #two empty coordinates.
+    max_turns = max(1, (num_of_cells - 2)//2)
+    corpus = []
+    for num in range(num_of_positions):
+        num_of_turns = 1 + num*(max_turns - 1)//max(1, num_of_positions - 1)
+        #Replays until the game is still going after that many turns, and
+        #(within SCORING_ATTEMPTS replays) the computer's turn needs scoring
+        #rather than being an instant win or block.
+        attempts = 0
+        while True:
+            board.set_position(0, 0)
+            empty_indices = list(range(num_of_cells))
+            rng.shuffle(empty_indices)
+            for index in empty_indices[:2*num_of_turns]:
+                board.place_mark(index, 'o' if board.line_counts.num_of_empty%2 == num_of_cells%2 else 'x')
+                if board.check_if_winner_exists():
+                    break
+            if board.check_if_winner_exists() or board.check_if_full_board():
+                num_of_turns = max(1, num_of_turns - 1)
+                continue
+            attempts += 1
+            if board.find_immediate_computer_turn() == None or attempts == SCORING_ATTEMPTS:
+                break
+        corpus.append((board.x_bits, board.o_bits))
+    return corpus
+
+def summarise(seconds):
+    '''
+    Returns the count, mean and percentiles (nearest rank) of the timings.
+    '''
+    seconds = sorted(seconds)
+    def percentile(p):
+        return seconds[max(0, -(-len(seconds)*p//100) - 1)]
+    return {
+        'count': len(seconds),
+        'mean': sum(seconds)/len(seconds),
+        'p50': percentile(50),
+        'p90': percentile(90),
+        'p99': percentile(99),
+        'max': seconds[-1]
+    }
+
+def benchmark_geometry(geometry, num_of_positions, repeat, scorer, workers, seed):
+    '''
+    Runs every benchmark on the corpus of one geometry. Returns its results.
+    '''
+    board = make_board(geometry, scorer, workers)
+    corpus = generate_corpus(geometry, num_of_positions, seed)
+
+    turn_seconds = []
+    score_seconds = []
+    winner_seconds = []
+    fills = 0
+    for x_bits, o_bits in corpus:
+        board.set_position(x_bits, o_bits)
+        first_option = board.generate_all_computer_options()[0]
+        simulation = board.simulate_computer_turn(*first_option)
+        num_of_empty = board.line_counts.num_of_empty - 1
+        for i in range(repeat):
+            start_time = time.perf_counter()
+            board.find_optimal_computer_turn()
+            turn_seconds.append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            board.generate_score_for_simulation(simulation)
+            score_seconds.append(time.perf_counter() - start_time)
+            fills += count_fills(num_of_empty)
+
+            start_time = time.perf_counter()
+            for call in range(WINNER_CHECK_CALLS):
+                board.check_if_winner_exists()
+            winner_seconds.append((time.perf_counter() - start_time)/WINNER_CHECK_CALLS)
+
+    #Peak memory is measured in a separate pass, since tracing allocations
+    #slows everything down.
+    tracemalloc.start()
+    for x_bits, o_bits in corpus:
+        board.set_position(x_bits, o_bits)
+        board.find_optimal_computer_turn()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    score_results = summarise(score_seconds)
+    score_results['fills'] = fills
+    score_results['fills_per_second'] = fills/sum(score_seconds) if sum(score_seconds) > 0 else 0.0
+    return {
+        'positions': len(corpus),
+        'find_optimal_computer_turn': summarise(turn_seconds),
+        'generate_score_for_simulation': score_results,
+        'check_if_winner_exists': summarise(winner_seconds),
+        'peak_traced_memory_bytes': peak_memory
+    }
+
+def peak_rss_bytes():
+    '''
+    Returns the peak resident memory of this process, or None where it isn't
+    available.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak*1024
+
+def run_benchmarks(geometries, num_of_positions=DEFAULT_POSITIONS, repeat=DEFAULT_REPEAT,
+                   scorer='enumerate', workers=1, seed=DEFAULT_SEED, log=print):
+    '''
+    Runs the benchmarks for every geometry and returns the full report.
+    '''
+    results = {}
+    start_time = time.perf_counter()
+    for geometry in geometries:
+        results[geometry_name(*geometry)] = benchmark_geometry(geometry, num_of_positions, repeat,
+                                                               scorer, workers, seed)
+        if log != None:
+            turn = results[geometry_name(*geometry)]['find_optimal_computer_turn']
+            score = results[geometry_name(*geometry)]['generate_score_for_simulation']
+            log(f'{geometry_name(*geometry):>9}  turn p50 {turn["p50"]*1000:9.2f} ms  '
+                f'p99 {turn["p99"]*1000:9.2f} ms  {score["fills_per_second"]:12.0f} fills/s')
+    return {
+        'format_version': FORMAT_VERSION,
+        'metadata': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': seed,
+            'positions': num_of_positions,
+            'repeat': repeat,
+            'scorer': scorer,
+            'workers': workers,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seconds': time.perf_counter() - start_time
+        },
+        'peak_rss_bytes': peak_rss_bytes(),
+        'results': results
+    }
+
+#Measurements compared, and whether a larger value is worse.
+COMPARED_MEASUREMENTS = [
+    ('find_optimal_computer_turn', 'p50', True),
+    ('find_optimal_computer_turn', 'p99', True),
+    ('generate_score_for_simulation', 'p50', True),
+    ('generate_score_for_simulation', 'fills_per_second', False),
+    ('check_if_winner_exists', 'p50', True),
+    ('peak_traced_memory_bytes', None, True)
+]
+
+def compare_reports(baseline, candidate, threshold=DEFAULT_THRESHOLD):
+    '''
+    Compares two reports made by run_benchmarks(). Returns a list of
+    (geometry, measurement, baseline value, candidate value, relative change,
+    regressed) for every measurement both reports have.
+    '''
+    comparisons = []
+    for name, baseline_results in baseline['results'].items():
+        candidate_results = candidate['results'].get(name)
+        if candidate_results == None:
+            continue
+        for benchmark, statistic, larger_is_worse in COMPARED_MEASUREMENTS:
+            if statistic == None:
+                measurement = benchmark
+                baseline_value = baseline_results.get(benchmark)
+                candidate_value = candidate_results.get(benchmark)
+            else:
+                measurement = f'{benchmark}.{statistic}'
+                baseline_value = baseline_results.get(benchmark, {}).get(statistic)
+                candidate_value = candidate_results.get(benchmark, {}).get(statistic)
+            if baseline_value == None or candidate_value == None or baseline_value == 0:
+                continue
+            change = (candidate_value - baseline_value)/baseline_value
+            regressed = change > threshold if larger_is_worse else change < -threshold
+            comparisons.append((name, measurement, baseline_value, candidate_value, change, regressed))
+    return comparisons
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the computer player without a display.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run the benchmarks and write the results as JSON')
+    run_parser.add_argument('--output', default='benchmark_results.json', help='file to write the results to')
+    run_parser.add_argument('--geometry', type=parse_geometry, action='append',
+                            help='geometry to run, as ROWSxCOLSxTO_WIN (default: every supported geometry)')
+    run_parser.add_argument('--positions', type=int, default=DEFAULT_POSITIONS, help='positions per geometry')
+    run_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='timed runs per position')
+    run_parser.add_argument('--scorer', default='enumerate', help='scorer for the boards, see scorers.py')
+    run_parser.add_argument('--workers', type=int, default=1, help='scoring processes for the boards')
+    run_parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='seed of the corpus')
+
+    compare_parser = subparsers.add_parser('compare', help='flag regressions between two runs')
+    compare_parser.add_argument('baseline', help='results of the earlier run')
+    compare_parser.add_argument('candidate', help='results of the later run')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help='relative change counted as a regression (default: 0.15)')
+
+    args = parser.parse_args(arguments)
+    if args.command == 'run':
+        report = run_benchmarks(args.geometry or supported_geometries(), args.positions, args.repeat,
+                                args.scorer, args.workers, args.seed)
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f'Results written to {args.output}')
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.candidate) as candidate_file:
+        candidate = json.load(candidate_file)
+    if baseline['metadata']['seed'] != candidate['metadata']['seed']:
+        print('Warning: the runs used different corpora (seeds differ)')
+    num_of_regressions = 0
+    for name, measurement, baseline_value, candidate_value, change, regressed in \
+            compare_reports(baseline, candidate, args.threshold):
+        if regressed:
+            num_of_regressions += 1
+        print(f'{"REGRESSION" if regressed else "ok":>10}  {name:>9}  {measurement:<40} '
+              f'{baseline_value:14.6g} -> {candidate_value:14.6g}  ({change:+.1%})')
+    print(f'{num_of_regressions} regression(s)')
+    return 1 if num_of_regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
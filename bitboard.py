@@ -0,0 +1,49 @@
+
+'''
+Bitboard helpers for the game board. A board is stored as two integers, one
+for 'x' and one for 'o'. Bit (row_index*num_of_cols + col_index) of an integer
+is set when that competitor has taken the coordinate.
+'''
+
+def coordinate_to_bit(row, col, num_of_cols):
+    '''
+    Converts a board coordinate (both starting at 0) to its bit on a bitboard.
+    '''
+    return 1 << (row*num_of_cols + col)
+
+def board_to_bits(board):
+    '''
+    Converts a nested list board of 'x', 'o' and '_' into a pair of bitboards,
+    (x_bits, o_bits).
+    '''
+    x_bits = 0
+    o_bits = 0
+    bit = 1
+    for row in board:
+        for element in row:
+            if element == 'x':
+                x_bits |= bit
+            elif element == 'o':
+                o_bits |= bit
+            bit <<= 1
+    return x_bits, o_bits
+
+def bits_to_board(x_bits, o_bits, num_of_rows, num_of_cols):
+    '''
+    Converts a pair of bitboards back into a nested list board of 'x', 'o'
+    and '_'.
+    '''
+    board = []
+    bit = 1
+    for row_index in range(num_of_rows):
+        row = []
+        for col_index in range(num_of_cols):
+            if x_bits & bit:
+                row.append('x')
+            elif o_bits & bit:
+                row.append('o')
+            else:
+                row.append('_')
+            bit <<= 1
+        board.append(row)
+    return board
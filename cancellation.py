@@ -0,0 +1,66 @@
+
+'''
+Cancellation tokens for the computer's turn. A search is given a token and
+checks it as it goes (between simulated boards, and every so many fills or
+nodes within one); once the token is cancelled, or its time budget runs out,
+the search stops and the best turn found so far is played.
+'''
+
+import threading
+import time
+
+#How many fills are tallied between checks of a token.
+CHECK_INTERVAL_FILLS = 16384
+#How long (in seconds) to wait on the scoring pool between checks of a token.
+POLL_INTERVAL = 0.02
+
+class CancellationToken:
+    def __init__(self, time_budget=None):
+        #Set by cancel(), shared with tokens made by with_time_budget().
+        self.cancel_event = threading.Event()
+        #time.monotonic() time after which the token counts as expired, or
+        #None if there is no time budget.
+        self.deadline = None if time_budget == None else time.monotonic() + time_budget
+
+    def cancel(self):
+        '''
+        Cancels the token, and every token made from it. Safe to call from
+        any thread.
+        '''
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def expired(self):
+        '''
+        Returns True if the token has been cancelled or its time budget has run
+        out.
+        '''
+        if self.cancel_event.is_set():
+            return True
+        return self.deadline != None and time.monotonic() >= self.deadline
+
+    def remaining(self):
+        '''
+        Returns the seconds left in the time budget (never negative), or None
+        if there is no time budget.
+        '''
+        if self.deadline == None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def with_time_budget(self, time_budget):
+        '''
+        Returns a token that is cancelled along with this one, and also
+        expires time_budget seconds from now (or when this one does, if
+        that's sooner). None returns this token.
+        '''
+        if time_budget == None:
+            return self
+        token = CancellationToken(time_budget)
+        token.cancel_event = self.cancel_event
+        if self.deadline != None:
+            token.deadline = min(token.deadline, self.deadline)
+        return token
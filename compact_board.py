@@ -0,0 +1,105 @@
+
+'''
+Compact, mutable storage for a game board. The marks are kept in one flat
+bytearray (b'_', b'x' or b'o' per coordinate, row by row), next to the pair of
+bitboards and the line counts, and moves are made and undone in place:
+    cells.make_move(index, 'o')
+    ... look at the simulated board ...
+    cells.undo_move()
+so simulating a turn restores the one buffer rather than copying the board.
+'''
+
+from line_counts import LineCounts
+
+EMPTY = ord('_')
+MARKS = {'x': ord('x'), 'o': ord('o')}
+
+class CompactBoard:
+    __slots__ = ('geometry', 'row_offsets', 'cells', 'x_bits', 'o_bits', 'line_counts', 'moves')
+
+    def __init__(self, geometry):
+        self.geometry = geometry
+        #Flat index of the first coordinate of each row, see geometry.py.
+        self.row_offsets = geometry.row_offsets
+        self.cells = bytearray(b'_'*geometry.num_of_cells)
+        self.x_bits = 0
+        self.o_bits = 0
+        self.line_counts = LineCounts(geometry)
+        #Flat indices of the moves made, most recent last, for undo_move().
+        self.moves = []
+
+    def index(self, row, col):
+        '''
+        Converts a board coordinate (both starting at 0) to its flat index.
+        '''
+        return self.row_offsets[row] + col
+
+    def cell(self, row, col):
+        '''
+        Returns 'x', 'o' or '_' for the coordinate.
+        '''
+        return chr(self.cells[self.row_offsets[row] + col])
+
+    def row_text(self, row):
+        '''
+        Returns the row as a string of 'x', 'o' and '_'.
+        '''
+        start = self.row_offsets[row]
+        return self.cells[start:start + self.geometry.num_of_cols].decode()
+
+    def make_move(self, index, competitor):
+        '''
+        Puts a mark of competitor ('x' or 'o') at the empty flat index, and
+        remembers it so it can be undone.
+        '''
+        self.put(index, competitor)
+        self.moves.append(index)
+
+    def undo_move(self):
+        '''
+        Takes back the most recent move, returning its flat index.
+        '''
+        index = self.moves.pop()
+        self.clear(index)
+        return index
+
+    def put(self, index, competitor):
+        '''
+        Puts a mark of competitor at the empty flat index, without remembering
+        it for undo_move().
+        '''
+        self.cells[index] = MARKS[competitor]
+        if competitor == 'x':
+            self.x_bits |= 1 << index
+        else:
+            self.o_bits |= 1 << index
+        self.line_counts.add_mark(index, competitor)
+
+    def clear(self, index):
+        '''
+        Removes any mark at the flat index.
+        '''
+        bit = 1 << index
+        if self.x_bits & bit:
+            self.x_bits &= ~bit
+            self.line_counts.remove_mark(index, 'x')
+        elif self.o_bits & bit:
+            self.o_bits &= ~bit
+            self.line_counts.remove_mark(index, 'o')
+        self.cells[index] = EMPTY
+
+    def set_position(self, x_bits, o_bits):
+        '''
+        Replaces the whole board with the one given as a pair of bitboards,
+        forgetting the moves made.
+        '''
+        self.cells[:] = b'_'*self.geometry.num_of_cells
+        self.x_bits = 0
+        self.o_bits = 0
+        self.line_counts = LineCounts(self.geometry)
+        for index in range(self.geometry.num_of_cells):
+            if x_bits >> index & 1:
+                self.put(index, 'x')
+            elif o_bits >> index & 1:
+                self.put(index, 'o')
+        self.moves = []
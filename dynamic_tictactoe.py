@@ -1,6 +1,15 @@
+import contextlib
 
-import copy
-import math
+from bitboard import board_to_bits, bits_to_board, coordinate_to_bit
+from cancellation import CHECK_INTERVAL_FILLS, CancellationToken
+from compact_board import CompactBoard
+from engines import make_engine
+from fill_space import count_fills
+from geometry import get_geometry
+from opening_book import default_opening_book
+from parallel_scoring import score_simulation, score_simulations
+from scorers import WHOLE_BOARD_SCORERS, get_scorer
+from transposition import shared_transposition_table
 
 HELP_MESSAGE = \
 '''
@@ -10,19 +19,138 @@ you'd type "1, 1"
 '''
 
 class Board:
-    def __init__(self, required_in_a_row, num_of_rows, num_of_cols):
+    def __init__(self, required_in_a_row, num_of_rows, num_of_cols, workers=1,
+                 scorer='enumerate', chunk_size=None,
+                 transposition_table=shared_transposition_table,
+                 opening_book=default_opening_book, engine=None, time_budget=None,
+                 instrumentation=None):
         self.required_in_a_row = required_in_a_row
         self.num_of_rows = num_of_rows
         self.num_of_cols = num_of_cols
+        #Number of processes used to score options. 1 scores them one after
+        #another in this process, None uses one process per core. See
+        #parallel_scoring.py.
+        self.workers = workers
+        #How the fills of a simulated board are tallied, see scorers.py.
+        #chunk_size bounds the memory used by the 'numpy' scorer.
+        self.scorer = scorer
+        self.chunk_size = chunk_size
+        self.tally_fills = get_scorer(scorer, chunk_size)
+        self.scores_whole_boards = scorer in WHOLE_BOARD_SCORERS
+        #Scores of simulated boards, shared across turns and games. None
+        #turns it off, see transposition.py.
+        self.transposition_table = transposition_table
+        #Scores of early positions, worked out offline. None turns it off, see
+        #opening_book.py.
+        self.opening_book = opening_book
+        #Engine used to pick the computer's turn instead of the permutation
+        #scoring, such as 'negamax', see engines.py.
+        self.engine = make_engine(engine)
+        #Seconds the computer's turn may take, after which the best turn
+        #found so far is played. None for no limit.
+        self.time_budget = time_budget
+        #False if the last computer turn was cut short by its time budget or
+        #by being cancelled.
+        self.last_turn_complete = True
+        #The options and their raw scores behind the last computer turn, or
+        #None if it didn't need scoring.
+        self.last_option_scores = None
+        #Whether progress of the computer's turn is printed to the console,
+        #and a function called with the progress (a percentage) as it changes,
+        #such as to show it in an interface.
+        self.show_progress = True
+        self.progress_callback = None
+        #Counters and phase timings of the computer's turns, None (the default)
+        #turns them off, see instrumentation.py. The stats record of the last
+        #turn is kept in self.last_move_stats.
+        self.instrumentation = instrumentation
+        self.last_move_stats = None
 
-        self.game_board = self.create_board(num_of_rows, num_of_cols)
+        #Win lines, perimeter etc. are shared by all boards with the same
+        #geometry, see geometry.py.
+        self.geometry = get_geometry(num_of_rows, num_of_cols, required_in_a_row)
+        self.win_masks = self.geometry.line_masks
+        self.full_bits = self.geometry.full_bits
+        #The board is stored as a flat buffer of marks, along with one
+        #bitboard per competitor and counts of each competitor's marks on
+        #every win line, all updated in place on every turn, see
+        #compact_board.py.
+        self.cells = CompactBoard(self.geometry)
 
         self.progress = 0
 
+    @property
+    def x_bits(self):
+        return self.cells.x_bits
+
+    @property
+    def o_bits(self):
+        return self.cells.o_bits
+
+    @property
+    def line_counts(self):
+        return self.cells.line_counts
+
+    @property
+    def game_board(self):
+        '''
+        The board as nested lists of 'x', 'o' and '_', built from the
+        bitboards. Changing the returned lists doesn't change the board; use
+        apply_player_turn() and apply_computer_turn(), or assign a whole new
+        nested list board instead.
+        '''
+        if self.instrumentation != None:
+            self.instrumentation.count('deep_copies')
+        return bits_to_board(self.x_bits, self.o_bits, self.num_of_rows, self.num_of_cols)
+
+    @game_board.setter
+    def game_board(self, board):
+        self.set_position(*board_to_bits(board))
+
+    def set_position(self, x_bits, o_bits):
+        '''
+        Replaces the whole board with the one given as a pair of bitboards.
+        '''
+        self.cells.set_position(x_bits, o_bits)
+
+    def copy(self):
+        '''
+        Returns a new board with the same position and options, sharing this
+        board's transposition table, opening book and engine.
+        '''
+        board = Board(self.required_in_a_row, self.num_of_rows, self.num_of_cols, self.workers,
+                      self.scorer, self.chunk_size, self.transposition_table, self.opening_book,
+                      self.engine, self.time_budget)
+        board.show_progress = self.show_progress
+        board.set_position(self.x_bits, self.o_bits)
+        return board
+
+    def place_mark(self, index, competitor):
+        '''
+        Puts a mark of competitor ('x' or 'o') at the flat index, replacing any
+        mark already there, and updates the line counts.
+        '''
+        self.cells.clear(index)
+        self.cells.put(index, competitor)
+
+    def make_move(self, index, competitor):
+        '''
+        Puts a mark of competitor ('x' or 'o') at the empty flat index, to be
+        taken back by self.undo_move(). Used to look at a simulated turn
+        without copying the board.
+        '''
+        self.cells.make_move(index, competitor)
+
+    def undo_move(self):
+        '''
+        Takes back the most recent self.make_move(), returning its flat index.
+        '''
+        return self.cells.undo_move()
+
     def flatten_board(self, board=None):
         '''
         Empties nested lists into a flat list and returns it.
-        Note: (col_index + num_of_rows*row_index) is the algorithm to convert
+        Note: (col_index + num_of_cols*row_index) is the algorithm to convert
         a board coordinate to a flattened board index
         '''
         if board == None:
@@ -37,93 +165,26 @@ class Board:
         '''
         #Assign board to the game board if not specified; sets game board as
         #default parameter
+        #The game board's own lines are already counted.
         if board == None:
-            board = self.game_board
-        #Check for X in a row, horizontally.
-        for row in board:
-            for index in range(len(row)):
-                for i in range(self.required_in_a_row):
-                    #Breaks if the row starts with an 'x', and is searching for computer wins.
-                    if competitor == 'computer' and row[index] == 'x':
-                        break
-                    #Breaks if the row starts with an 'o', and is searching for player wins.
-                    elif competitor == 'player' and row[index] == 'o':
-                        break
-                    #Breaks if the row starts with an '_'.
-                    elif row[index] == '_':
-                        break
-                    #Checks neighbouring (horizontal) value.
-                    try:
-                        if row[index] != row[index+i]:
-                            break
-                    except:
-                        break
-                    #If a certain amount of neighbouring horizontal values are equal to each other.
-                    if i == self.required_in_a_row-1:
-                        return True
-        #Check for X in a row, vertically.
-        columns = list(zip(*board))
-        for column in columns:
-            for index in range(len(column)):
-                for i in range(self.required_in_a_row):
-                    #Breaks if the column starts with an 'x', and is searching for computer wins.
-                    if competitor == 'computer' and column[index] == 'x':
-                        break
-                    #Breaks if the column starts with an 'o', and is searching for player wins.
-                    elif competitor == 'player' and column[index] == 'o':
-                        break
-                    #Breaks if the column starts with an '_'.
-                    elif column[index] == '_':
-                        break
-                    #Checks neighbouring (vertial) value.
-                    try:
-                        if column[index] != column[index+i+1]:
-                            break
-                    except:
-                        break
-                #If a certain amount of neighbouring vertial values are equal to each other.
-                if i == self.required_in_a_row-1:
-                    return True
-        #Check for diagonals.
-        for index1 in range(len(board)):
-            for index2 in range(len(board[0])):
-                diagonal_SE = True #South East
-                diagonal_SW = True #South West
-                for i in range(self.required_in_a_row):
-                    #No win if the row starts with an 'x', and is searching for computer wins.
-                    if competitor == 'computer' and board[index1][index2] == 'x':
-                        diagonal_SE, diagonal_SW = False, False
-                        break
-                    #No win if the row starts with an 'o', and is searching for player wins.
-                    elif competitor == 'player' and board[index1][index2] == 'o':
-                        diagonal_SE, diagonal_SW = False, False
-                        break
-                    #No win if row starts with '_'.
-                    elif board[index1][index2] == '_':
-                        diagonal_SE, diagonal_SW = False, False
-                        break
-                    #Checks neighbouring diagonal values SE direction.
-                    try:
-                        if board[index1][index2] != board[index1+i][index2+i]:
-                            diagonal_SE = False
-                    except:
-                        diagonal_SE = False
-                    #Makes sure it's not checking diagonal values using negative coordinates.
-                    if index2-i < 0:
-                        diagonal_SW = False
-                    #Checks neighbouring diagonal values SW direction.
-                    try:
-                        if board[index1][index2] != board[index1+i][index2-i]:
-                            diagonal_SW = False
-                    except:
-                        diagonal_SW = False
-                    #Cancels search if confirmed that it's not diagonal in either direction.
-                    if diagonal_SE == False and diagonal_SW == False:
-                        break
-                #If a certain amount of neighbouring diagonal values are equal to each other.
-                if diagonal_SE or diagonal_SW:
-                    return True
-        #If all above fails, the game isn't over yet.
+            if self.instrumentation != None:
+                self.instrumentation.count('winner_checks')
+            return self.line_counts.winner_exists({'computer': 'o', 'player': 'x'}.get(competitor, 'either'))
+        x_bits, o_bits = board_to_bits(board)
+        return self.check_if_winner_exists_bits(x_bits, o_bits, competitor)
+
+    def check_if_winner_exists_bits(self, x_bits, o_bits, competitor='either'):
+        '''
+        Same as self.check_if_winner_exists(), but for a board given as a pair
+        of bitboards. 'computer' only looks for lines of 'o', 'player' only
+        looks for lines of 'x' and 'either' looks for both.
+        '''
+        if self.instrumentation != None:
+            self.instrumentation.count('winner_checks')
+        if competitor != 'player' and self.geometry.has_line(o_bits):
+            return True
+        if competitor != 'computer' and self.geometry.has_line(x_bits):
+            return True
         return False
 
     def check_if_full_board(self):
@@ -132,11 +193,7 @@ class Board:
         '_'. If any are, the game isn't over. Otherwise, all values are
         either 'o' or 'x' and hence the game is over, with a draw.
         '''
-        flattened_board = self.flatten_board()
-        for i in flattened_board:
-            if i == '_':
-                return False
-        return True
+        return self.line_counts.num_of_empty == 0
 
     def create_board(self, num_rows, num_cols):
         '''
@@ -149,19 +206,18 @@ class Board:
         '''
         Changes speficied column and row value (both starting at 1) to 'x'.
         '''
-        self.game_board[row][col] = 'x'
+        self.place_mark(row*self.num_of_cols + col, 'x')
 
     def print_current_board(self):
         '''
         Takes the current board and prints it in the console in a more readable
         format.
         '''
-        board_print = copy.deepcopy(self.game_board)
         #Prints the numbers of the columns.
-        print('   ' + '  '.join([str(i+1) for i in range(len(board_print[0]))]))
+        print('   ' + '  '.join([str(i+1) for i in range(self.num_of_cols)]))
         #Prints the numbers of the rows, and the actual rows.
-        for num, row in enumerate(board_print):
-            print(f'{str(num+1)}  {"  ".join(row)}')
+        for num in range(self.num_of_rows):
+            print(f'{str(num+1)}  {"  ".join(self.cells.row_text(num))}')
         #Prints an extra return.
         print('')
 
@@ -181,7 +237,9 @@ class Board:
             try:
                 row = int(player_input.split(', ')[0])
                 column = int(player_input.split(', ')[-1])
-                if self.game_board[row-1][column-1] != '_':
+                if row < 1 or column < 1 or row > self.num_of_rows or column > self.num_of_cols:
+                    raise IndexError
+                if self.cells.cell(row-1, column-1) != '_':
                     print('Invalid entry! Place taken. Try again.\n')
                     continue
                 break
@@ -201,18 +259,20 @@ class Board:
         'o', meaning the computer can take its turn there.
         '''
         computer_options = []
-        for row_index, row in enumerate(self.game_board):
-            for col_index in range(len(row)):
-                if self.game_board[row_index][col_index] == '_':
+        taken_bits = self.x_bits | self.o_bits
+        for row_index in range(self.num_of_rows):
+            for col_index in range(self.num_of_cols):
+                if not taken_bits & coordinate_to_bit(row_index, col_index, self.num_of_cols):
                     computer_options.append([row_index, col_index])
         return computer_options
 
     def simulate_computer_turn(self, row, col):
         '''
-        Simulates a deep copy of the current board and applies an 'o' as the
+        Simulates a copy of the current board and applies an 'o' as the
         computer's turn at the given coordinates.
         '''
-        copy_board = copy.deepcopy(self.game_board)
+        #Counted as a deep copy by self.game_board.
+        copy_board = self.game_board
         copy_board[row][col] = 'o'
         return copy_board
 
@@ -229,75 +289,155 @@ class Board:
             all_computer_turns.append(self.simulate_computer_turn(coordinate[0], coordinate[1]))
         return all_computer_turns
 
+    def advance_permutation(self, permutation):
+        '''
+        Changes the given permutation sequence in place into the next
+        permutation sequence in lexiographic order. Returns False, leaving the
+        sequence unchanged, if it was already the last one. See:
+        https://en.wikipedia.org/wiki/Permutation#Generation_in_lexicographic_order
+        '''
+        length = len(permutation)
+        #Finds the last element that is smaller than the element after it.
+        i = length - 2
+        while i >= 0 and permutation[i] >= permutation[i+1]:
+            i -= 1
+        if i < 0:
+            return False
+        #Finds the last element that is greater than it, and swaps them.
+        j = length - 1
+        while permutation[j] <= permutation[i]:
+            j -= 1
+        permutation[i], permutation[j] = permutation[j], permutation[i]
+        #Reverses everything after it.
+        left, right = i + 1, length - 1
+        while left < right:
+            permutation[left], permutation[right] = permutation[right], permutation[left]
+            left += 1
+            right -= 1
+        return True
+
     def generate_next_perm(self, permutation):
         '''
         Generates the next permutation sequence in lexiographic order using the
         previous permutation sequence. See:
         https://en.wikipedia.org/wiki/Permutation#Generation_in_lexicographic_order
         '''
-        length = len(permutation)
         next_perm = permutation[:]
-        for i in range(length-2, -1, -1):
-            if permutation[i] < permutation[i+1]:
-                break
-        for j in range(length-1, i, -1):
-            if permutation[j] > permutation[i]:
-                break
-        next_perm[i], next_perm[j] = next_perm[j], next_perm[i]
-        return next_perm[:i+1] + list(reversed(next_perm[i+1:]))
+        self.advance_permutation(next_perm)
+        return next_perm
 
     def generate_permutations(self, vlist):
         '''
-        Generates all permutations of a given list in lexiographic order. See:
+        Generates all permutations of a given list in lexiographic order, one
+        at a time as they are needed. See:
         https://en.wikipedia.org/wiki/Permutation#Generation_in_lexicographic_order
+        The same list is updated in place and yielded for every permutation, so
+        memory stays flat however many permutations there are. Copy it if it
+        needs to be kept past the next permutation.
         '''
-        first_seq = sorted(vlist)
-        last_seq = list(reversed(first_seq))
-        permutations = [first_seq]
-        while permutations[-1] != last_seq:
-            permutations += [self.generate_next_perm(permutations[-1])]
-        return permutations
+        permutation = sorted(vlist)
+        instrumentation = self.instrumentation
+        while True:
+            if instrumentation != None:
+                instrumentation.count('permutations')
+            yield permutation
+            if not self.advance_permutation(permutation):
+                break
 
     def generate_score_for_simulation(self, simulation):
         '''
         Generates a score for a given simulated board based on how many future
         outcomes from the simulated board win and lose.
         '''
-        flattened_board = self.flatten_board(simulation)
-        num_of_turns_taken = flattened_board.count('_')
-        permutation_seed = ['x' if i%2 == 0 else 'o' for i in range(num_of_turns_taken)]
-        permutations = self.generate_permutations(permutation_seed)
-        #Each permutation has each of its elements placed in all the empty spots
-        #of the current simulated board to generate a possible future board that
-        #is full. If that future board leads to either the player or computer
-        #winning, it is worth considering when generating the final score.
-        simulated_outcomes = []
-        for permutation in permutations:
-            copy_board = copy.deepcopy(simulation)
-            for index1, row in enumerate(copy_board):
-                for index2, element in enumerate(row):
-                    if element == '_':
-                        copy_board[index1][index2] = permutation[-1]
-                        permutation.pop()
-            if self.check_if_winner_exists(copy_board):
-                simulated_outcomes.append(copy_board)
-        #This adds a point for every board where the computer wins, and subtracts a
-        #point for every board where the computer loses.
+        x_bits, o_bits = board_to_bits(simulation)
+        score = self.lookup_score(x_bits, o_bits)
+        if score == None:
+            score = self.generate_score_for_bits(x_bits, o_bits)
+            self.store_score(x_bits, o_bits, score)
+        return score
+
+    def generate_score_for_bits(self, x_bits, o_bits, cancel_token=None):
+        '''
+        Same as self.generate_score_for_simulation(), but for a simulated board
+        given as a pair of bitboards, and without using the transposition
+        table. Returns None if the cancellation token expires before the score
+        is complete.
+        '''
+        taken_bits = x_bits | o_bits
+        empty_indices = [index for index in range(self.geometry.num_of_cells) if not taken_bits >> index & 1]
+        #Every way of placing the remaining 'x's and 'o's in the empty spots of
+        #the current simulated board gives a possible future board that is
+        #full. These are walked directly as choices of which empty spots get
+        #an 'x', see fill_space.py. This adds a point for every future board
+        #where the computer wins, and subtracts a point for every future board
+        #where the computer loses. In parallel mode the fills are split into
+        #contiguous ranges that are tallied by the scoring pool and merged.
+        #Scorers that count whole boards at once are always run here.
+        if self.scores_whole_boards:
+            if cancel_token != None and cancel_token.expired():
+                return None
+            computer_wins, player_wins = self.tally_fills(self.geometry, x_bits, o_bits, empty_indices)
+            if self.instrumentation != None:
+                self.count_scored_fills(count_fills(len(empty_indices)))
+            return computer_wins - player_wins
+        if self.workers != 1:
+            score = score_simulation(self.geometry, x_bits, o_bits, self.workers, self.tally_fills, cancel_token)
+            if self.instrumentation != None and score != None:
+                self.count_scored_fills(count_fills(len(empty_indices)))
+            return score
+        if cancel_token == None:
+            computer_wins, player_wins = self.tally_fills(self.geometry, x_bits, o_bits, empty_indices)
+            if self.instrumentation != None:
+                self.count_scored_fills(count_fills(len(empty_indices)))
+            return computer_wins - player_wins
+        #With a cancellation token, the fills are tallied a range at a time,
+        #checking the token in between.
         score = 0
-        for outcome in simulated_outcomes:
-            if self.check_if_winner_exists(outcome, 'computer'):
-                score += 1
-            if self.check_if_winner_exists(outcome, 'player'):
-                score -= 1
+        num_of_fills = count_fills(len(empty_indices))
+        for start in range(0, num_of_fills, CHECK_INTERVAL_FILLS):
+            if cancel_token.expired():
+                return None
+            stop = min(start + CHECK_INTERVAL_FILLS, num_of_fills)
+            computer_wins, player_wins = self.tally_fills(self.geometry, x_bits, o_bits, empty_indices, start, stop)
+            if self.instrumentation != None:
+                self.count_scored_fills(stop - start)
+            score += computer_wins - player_wins
         return score
 
+    def count_scored_fills(self, num_of_fills):
+        '''
+        Counts fills scored for the instrumentation, along with the winner
+        checks behind them: every fill the tally goes through is checked for
+        a line of each competitor. Scorers that count whole boards at once
+        don't check fills one by one.
+        '''
+        self.instrumentation.count('fills', num_of_fills)
+        if not self.scores_whole_boards:
+            self.instrumentation.count('winner_checks', 2*num_of_fills)
+
+    def lookup_score(self, x_bits, o_bits):
+        '''
+        Returns the score of the simulated board from the transposition table,
+        or None if it isn't there (or there is no transposition table).
+        '''
+        if self.transposition_table == None:
+            return None
+        return self.transposition_table.lookup(self.geometry, x_bits, o_bits)
+
+    def store_score(self, x_bits, o_bits, score):
+        '''
+        Stores the score of the simulated board in the transposition table, if
+        there is one.
+        '''
+        if self.transposition_table != None:
+            self.transposition_table.store(self.geometry, x_bits, o_bits, score)
+
     def check_if_first_turn(self):
         '''
         Determines whether the board is empty (hence the turn being taken is the
         first) or not. If so, returns True. Otherwise, returns False.
         '''
-        flattened_board = self.flatten_board()
-        if flattened_board.count('o') == 0:
+        if self.x_bits | self.o_bits == 0:
             return True
         return False
 
@@ -307,22 +447,12 @@ class Board:
         were make their next move, they would win. Returns an array of integers.
         If there are no winning indices, returns an empty list.
         '''
-        win_indices = []
-
-        empty_spaces = []
-        for row_index, row in enumerate(self.game_board):
-            for col_index in range(len(row)):
-                if self.game_board[row_index][col_index] == '_':
-                    empty_spaces.append([row_index, col_index])
-
-        for i in range(len(empty_spaces)):
-            copy_board = copy.deepcopy(self.game_board)
-            space = empty_spaces[i]
-            row_index, col_index = space[0], space[1]
-            copy_board[row_index][col_index] = 'x'
-            if self.check_if_winner_exists(copy_board):
-                win_indices.append([row_index, col_index])
-        return win_indices
+        #If there is already a winner, every move "wins".
+        if self.check_if_winner_exists():
+            return self.generate_all_computer_options()
+        #Otherwise they're the gaps in lines the player is one short of.
+        return [[index//self.num_of_cols, index%self.num_of_cols]
+                for index in self.line_counts.winning_indices('x', self.x_bits | self.o_bits)]
 
     def subtract_scores_indices(self):
         '''
@@ -342,82 +472,230 @@ class Board:
         It would skip 3, because thats not part of the outside perimeter as shown
         on the 2D board.
         '''
-        flattened_board = self.flatten_board()
         #These are the indices of the flattened board that form the perimeter.
-        perimeter_indices = set()
-        for i in range(0, self.num_of_rows*self.num_of_cols, self.num_of_cols):
-            perimeter_indices.add(i) #Left
-            perimeter_indices.add(i-1+self.num_of_cols) #Right
-        for i in range(0, self.num_of_rows):
-            perimeter_indices.add(i) #Top
-            perimeter_indices.add(len(flattened_board)-1-i) #Bottom
+        perimeter_indices = self.geometry.perimeter_indices
         #This selects indices of the flattened function that are empty, and part
         #of the perimeter, and allocates the correct index to each, indicated
         #by the index_counter.
         subtract_indices = []
         index_counter = 0
-        for index, element in enumerate(flattened_board):
-            if element == '_':
+        taken_bits = self.x_bits | self.o_bits
+        for index in range(self.geometry.num_of_cells):
+            if not taken_bits >> index & 1:
                 if index in perimeter_indices:
                     subtract_indices.append(index_counter)
                 index_counter += 1
         return subtract_indices
 
-    def find_optimal_computer_turn(self):
-        '''
-        This returns the coordinates of the best computer turn possible, such
-        as [1, 1], by using scores generated for each possible future turn.
-        '''
-        list_of_options = self.generate_all_computer_options()
-        list_of_options_simulated = self.simulate_all_computer_turns()
-        #If one of the options leads to an instant computer win, just choose that.
-        for sim in list_of_options_simulated:
-            if self.check_if_winner_exists(sim):
-                return list_of_options[list_of_options_simulated.index(sim)]
+    def find_immediate_computer_turn(self):
+        '''
+        Returns the coordinates of a computer turn that can be found without
+        scoring every option: an instant win, a block of the player's instant
+        win, or the first turn of the game. Otherwise, returns None.
+        '''
+        #If one of the options leads to an instant computer win, just choose
+        #that. These are the gaps in lines the computer is one short of (or
+        #any option, if there is already a winner).
+        with self.time_phase('instant_win_scan'):
+            if self.check_if_winner_exists():
+                list_of_options = self.generate_all_computer_options()
+                if len(list_of_options) > 0:
+                    return list_of_options[0]
+            win_indices = self.line_counts.winning_indices('o', self.x_bits | self.o_bits)
+            if len(win_indices) > 0:
+                return [win_indices[0]//self.num_of_cols, win_indices[0]%self.num_of_cols]
         #If the player wins next turn, the computer must block them. This was
         #implemented because the computer would be greedy and try to win despite
         #the player's moves, causing it to lose on a 3x6 board when the player
         #selected (2,2), (3,2), (1,2)
-        player_win_indices = self.find_player_win_coordinates()
-        if len(player_win_indices) > 0:
-            return player_win_indices[0]
+        with self.time_phase('block_scan'):
+            player_win_indices = self.find_player_win_coordinates()
+            if len(player_win_indices) > 0:
+                return player_win_indices[0]
+        #If the player doesn't want to wait for turn 1, it can instantly be generated.
+        if self.check_if_first_turn():
+            return [(self.num_of_rows - 1)//2, (self.num_of_cols - 1)//2]
+        return None
+
+    def find_optimal_computer_turn(self, cancel_token=None, time_budget=None):
+        '''
+        This returns the coordinates of the best computer turn possible, such
+        as [1, 1], by using scores generated for each possible future turn.
+        Scores come from the opening book when it has the position, see
+        opening_book.py. If the board has an engine, the engine picks the
+        turn instead.
+        The search stops early if the cancellation token is cancelled, or
+        after time_budget seconds (self.time_budget if not given), and the best
+        turn found so far is returned, see cancellation.py.
+        '''
+        if time_budget == None:
+            time_budget = self.time_budget
+        if cancel_token == None and time_budget != None:
+            cancel_token = CancellationToken()
+        if cancel_token != None:
+            cancel_token = cancel_token.with_time_budget(time_budget)
+        self.last_turn_complete = True
+        self.last_option_scores = None
+        if self.instrumentation == None:
+            return self.search_for_computer_turn(cancel_token)
+        self.instrumentation.start_move()
+        turn = self.search_for_computer_turn(cancel_token)
+        self.last_move_stats = self.instrumentation.finish_move(self, turn)
+        return turn
+
+    def search_for_computer_turn(self, cancel_token=None):
+        '''
+        The search behind self.find_optimal_computer_turn(), split up into the
+        phases timed by the board's instrumentation.
+        '''
+        if self.engine != None:
+            with self.time_phase('engine_search'):
+                turn = self.engine.find_turn(self, cancel_token)
+            #The engine says whether its own budget cut it short too.
+            self.last_turn_complete = getattr(self.engine, 'last_search', {}).get(
+                'complete', cancel_token == None or not cancel_token.expired())
+            return turn
+        immediate_turn = self.find_immediate_computer_turn()
+        if immediate_turn != None:
+            return immediate_turn
+        with self.time_phase('candidate_generation'):
+            list_of_options = self.generate_all_computer_options()
+        with self.time_phase('opening_book'):
+            scores = self.lookup_opening_book(list_of_options)
+        if scores == None:
+            with self.time_phase('scoring'):
+                scores = self.generate_option_scores(list_of_options, cancel_token)
+            self.last_turn_complete = None not in scores
+        self.last_option_scores = (list_of_options, scores)
+        with self.time_phase('perimeter_adjustment'):
+            return self.choose_option_from_scores(list_of_options, scores)
+
+    def time_phase(self, phase):
+        '''
+        Returns a context manager timing the phase of the computer's turn, if
+        the board has instrumentation. Otherwise, it does nothing.
+        '''
+        if self.instrumentation == None:
+            return contextlib.nullcontext()
+        return self.instrumentation.phase(phase)
+
+    def lookup_opening_book(self, list_of_options):
+        '''
+        Returns the scores for each option from the opening book, in the same
+        order as the options, or None if the book doesn't have the position
+        (or there is no opening book).
+        '''
+        if self.opening_book == None:
+            return None
+        cell_scores = self.opening_book.lookup(self.geometry, self.x_bits, self.o_bits)
+        if cell_scores == None:
+            return None
+        return [cell_scores[option[0]*self.num_of_cols + option[1]] for option in list_of_options]
+
+    def generate_option_scores(self, list_of_options, cancel_token=None):
+        '''
+        Generates scores in the same index for each option, in a list, showing
+        progress as it goes. If the cancellation token expires, the options
+        not scored yet get a score of None.
+        '''
         #Percentage gain and progress, because generation can sometimes take a while.
         percentage_gain = 100/len(list_of_options)
         self.progress = 0
-        #If the player doesn't want to wait for turn 1, it can instantly be generated.
-        if self.check_if_first_turn():
-            return [(len(self.game_board) - 1)//2, (len(self.game_board[0]) - 1)//2]
-        #Generates scores in the same index for each option, in a list.
+        #If the board is symmetric, options that are rotations/reflections of
+        #each other have the same score, so only the first option of each
+        #such group (its representative) is scored, and the rest copy it.
+        option_positions = {}
+        representatives = []
+        stabilizer = self.geometry.find_stabilizer(self.x_bits, self.o_bits)
+        for num, option in enumerate(list_of_options):
+            index = option[0]*self.num_of_cols + option[1]
+            option_positions[index] = num
+            representatives.append(option_positions[self.geometry.orbit_representative(index, stabilizer)])
+        #Representatives whose simulated board (or a rotation/reflection of it)
+        #was scored before come straight from the transposition table. In
+        #parallel mode every other representative is sent off to the scoring
+        #pool up front, and the scores are collected in order below.
+        #Each simulated board is looked at by making the computer's turn on
+        #this board and taking it back again, rather than copying the board.
+        simulations_bits = []
+        for option in list_of_options:
+            self.make_move(option[0]*self.num_of_cols + option[1], 'o')
+            simulations_bits.append((self.x_bits, self.o_bits))
+            self.undo_move()
+        cached_scores = [self.lookup_score(*simulations_bits[num]) if representatives[num] == num else None
+                         for num in range(len(list_of_options))]
+        parallel_scores = None
+        if self.workers != 1 and not self.scores_whole_boards:
+            parallel_scores = score_simulations(
+                self.geometry,
+                [simulations_bits[num] for num in range(len(list_of_options))
+                 if representatives[num] == num and cached_scores[num] == None],
+                self.workers,
+                self.tally_fills,
+                cancel_token
+            )
         scores = []
-        for num, sim in enumerate(list_of_options_simulated):
+        for num in range(len(list_of_options)):
             ########################################################################
             #Code for showing the player the progress of the computer's turn.
-            if percentage_gain < 8:
-                if percentage_gain < 6:
+            if percentage_gain < 8 and self.show_progress:
+                if percentage_gain < 6 or num%2 == 0:
                     print(f'Computer processing... {round(self.progress)}%')
-                    self.progress += percentage_gain
-                else:
-                    if num%2 == 0:
-                        print(f'Computer processing... {round(self.progress)}%')
-                    self.progress += percentage_gain
+            if self.progress_callback != None:
+                self.progress_callback(self.progress)
+            self.progress += percentage_gain
             ########################################################################
-            scores.append(self.generate_score_for_simulation(sim))
+            if representatives[num] != num:
+                scores.append(scores[representatives[num]])
+                continue
+            if cached_scores[num] != None:
+                scores.append(cached_scores[num])
+                continue
+            x_bits, o_bits = simulations_bits[num]
+            if parallel_scores != None:
+                score = next(parallel_scores)
+                if self.instrumentation != None and score != None:
+                    self.count_scored_fills(count_fills(self.geometry.num_of_cells - bin(x_bits | o_bits).count('1')))
+            else:
+                score = self.generate_score_for_bits(x_bits, o_bits, cancel_token)
+            if score == None:
+                #Out of time, the rest of the options aren't scored.
+                scores += [None]*(len(list_of_options) - num)
+                break
+            self.store_score(x_bits, o_bits, score)
+            scores.append(score)
         #Return to the next row in the console, if required.
-        if percentage_gain < 8:
+        if percentage_gain < 8 and self.show_progress:
             print('')
+        return scores
+
+    def choose_option_from_scores(self, list_of_options, scores):
+        '''
+        Returns the option with the greatest score, after adjusting the scores
+        of options on the perimeter. Options with a score of None (not scored
+        in time) are skipped.
+        '''
+        scores = list(scores)
+        #If nothing was scored in time, the option on the most win lines is
+        #the best guess.
+        if all(score == None for score in scores):
+            return max(list_of_options,
+                       key=lambda option: len(self.geometry.cell_lines[option[0]*self.num_of_cols + option[1]]))
         #Adjust for boards where both player and computer win. This just
         #reduces the scores of the perimeter scores by 10%.
         for i in self.subtract_scores_indices():
-            scores[i] -= 0.1*scores[i]
+            if scores[i] != None:
+                scores[i] -= 0.1*scores[i]
         #The greatest score is the largest one. Returns the move with the greatest score.
-        best_option_index = scores.index(max(scores))
+        best_score = max(score for score in scores if score != None)
+        best_option_index = scores.index(best_score)
         return list_of_options[best_option_index]
 
     def apply_computer_turn(self, optimal_turn):
         '''
         Changes the specified location on the board to an 'o'.
         '''
-        self.game_board[optimal_turn[0]][optimal_turn[1]] = 'o'
+        self.place_mark(optimal_turn[0]*self.num_of_cols + optimal_turn[1], 'o')
 
 def gain_valid_int_input(message):
     '''
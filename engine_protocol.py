@@ -0,0 +1,220 @@
+
+'''
+Long-lived engine mode. Reads one command per line from stdin and answers on
+stdout, in the spirit of UCI, so one process (with its geometry tables,
+transposition table, opening books and scoring pool kept warm) can serve game
+after game. Run it with:
+    python engine_protocol.py
+
+Commands:
+    isready                       answers readyok (once any search is done)
+    setoption name <n> value <v>  engine (permutation, negamax, mcts, threats),
+                                  workers or scorer, used from the next newgame
+    newgame <rows> <cols> <k>     starts a game on an empty board, of at most
+                                  MAX_BOARD_SPACES spaces without an engine or
+                                  MAX_HEURISTIC_BOARD_SPACES with one (see
+                                  geometry.py)
+    position <cells>              sets the board, one character per
+                                  coordinate, row by row: x, o, or _ (or .)
+                                  for empty. The side to move is worked out
+                                  from the counts: 'o' if they're equal,
+                                  otherwise 'x'.
+    position startpos             empties the board
+    go [movetime <ms>|infinite]   finds the best turn for the side to move, in
+                                  the background
+    stop                          stops the search, which answers with the
+                                  best turn found so far
+    quit                          exits
+
+A search answers with info lines, then the turn (rows and columns start at 1):
+    info time <ms> complete <true|false> [score <raw score>] [<engine stats>]
+    bestmove <row> <col>
+Errors are answered with a line starting with 'error'.
+'''
+
+import sys
+import threading
+import time
+
+from cancellation import CancellationToken
+from dynamic_tictactoe import Board
+from engines import make_engine
+from geometry import MAX_BOARD_SPACES, MAX_HEURISTIC_BOARD_SPACES
+
+CELL_CHARACTERS = {'x': 'x', 'o': 'o', '_': None, '.': None, '-': None}
+
+def parse_cells(cells, geometry):
+    '''
+    Returns (x_bits, o_bits) for a board given as cells, one character per
+    coordinate, row by row. Raises ValueError if they don't fit the geometry.
+    '''
+    cells = cells.lower()
+    if len(cells) != geometry.num_of_cells:
+        raise ValueError(f'expected {geometry.num_of_cells} cells, got {len(cells)}')
+    x_bits = o_bits = 0
+    for index, cell in enumerate(cells):
+        if cell not in CELL_CHARACTERS:
+            raise ValueError(f'unknown cell {cell!r}')
+        if CELL_CHARACTERS[cell] == 'x':
+            x_bits |= 1 << index
+        elif CELL_CHARACTERS[cell] == 'o':
+            o_bits |= 1 << index
+    return x_bits, o_bits
+
+class EngineProtocol:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.board = None
+        #Options for the next game's board. The engine object is kept between
+        #games, so its own tables stay warm too.
+        self.engine = None
+        self.workers = 1
+        self.scorer = 'enumerate'
+        self.search_thread = None
+        self.cancel_token = None
+        self.commands = {
+            'isready': self.command_isready,
+            'setoption': self.command_setoption,
+            'newgame': self.command_newgame,
+            'position': self.command_position,
+            'go': self.command_go,
+            'stop': self.command_stop
+        }
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def wait_for_search(self):
+        if self.search_thread != None:
+            self.search_thread.join()
+            self.search_thread = None
+
+    def handle(self, line):
+        '''
+        Handles one command line. Returns False once told to quit.
+        '''
+        words = line.split()
+        if not words:
+            return True
+        if words[0] == 'quit':
+            self.command_stop([])
+            return False
+        command = self.commands.get(words[0])
+        if command == None:
+            self.send(f'error unknown command {words[0]}')
+            return True
+        #Only stop may interrupt a search, everything else waits for it.
+        if words[0] != 'stop':
+            self.wait_for_search()
+        try:
+            command(words[1:])
+        except ValueError as error:
+            self.send(f'error {error}')
+        return True
+
+    def command_isready(self, arguments):
+        self.send('readyok')
+
+    def command_setoption(self, arguments):
+        if len(arguments) != 4 or arguments[0] != 'name' or arguments[2] != 'value':
+            raise ValueError('usage: setoption name <name> value <value>')
+        name, value = arguments[1], arguments[3]
+        if name == 'engine':
+            self.engine = make_engine(value)
+        elif name == 'workers':
+            self.workers = None if value == 'auto' else int(value)
+        elif name == 'scorer':
+            self.scorer = value
+        else:
+            raise ValueError(f'unknown option {name}')
+
+    def command_newgame(self, arguments):
+        if len(arguments) != 3:
+            raise ValueError('usage: newgame <rows> <cols> <k>')
+        num_of_rows, num_of_cols, required_in_a_row = (int(argument) for argument in arguments)
+        if min(num_of_rows, num_of_cols, required_in_a_row) < 1:
+            raise ValueError('rows, cols and k must be at least 1')
+        max_board_spaces = MAX_BOARD_SPACES if self.engine == None else MAX_HEURISTIC_BOARD_SPACES
+        if num_of_rows*num_of_cols > max_board_spaces:
+            raise ValueError(f'boards are limited to {max_board_spaces} spaces'
+                             + (' without an engine' if max_board_spaces == MAX_BOARD_SPACES else ''))
+        #What the engine kept from the last game is no use on another board.
+        if self.board != None and self.engine != None and hasattr(self.engine, 'reset') \
+                and (self.board.num_of_rows, self.board.num_of_cols, self.board.required_in_a_row) \
+                != (num_of_rows, num_of_cols, required_in_a_row):
+            self.engine.reset()
+        self.board = Board(required_in_a_row, num_of_rows, num_of_cols, workers=self.workers,
+                           scorer=self.scorer, engine=self.engine)
+        self.board.show_progress = False
+
+    def command_position(self, arguments):
+        if self.board == None:
+            raise ValueError('no game, send newgame first')
+        if arguments == ['startpos']:
+            self.board.set_position(0, 0)
+            return
+        x_bits, o_bits = parse_cells(''.join(arguments), self.board.geometry)
+        num_of_x, num_of_o = bin(x_bits).count('1'), bin(o_bits).count('1')
+        if num_of_o - num_of_x not in (0, 1):
+            raise ValueError('o moves first, so o must have as many marks as x, or one more')
+        self.board.set_position(x_bits, o_bits)
+
+    def command_go(self, arguments):
+        if self.board == None:
+            raise ValueError('no game, send newgame first')
+        time_budget = None
+        if arguments[:1] == ['movetime']:
+            if len(arguments) != 2:
+                raise ValueError('usage: go movetime <ms>')
+            time_budget = int(arguments[1])/1000
+        elif arguments not in ([], ['infinite']):
+            raise ValueError('usage: go [movetime <ms>|infinite]')
+        if self.board.check_if_winner_exists() or self.board.check_if_full_board():
+            raise ValueError('the game is over')
+        #The search is always for 'o', so if it's 'x' to move, the search runs
+        #on a copy of the board with the marks swapped.
+        board = self.board
+        if bin(board.o_bits).count('1') > bin(board.x_bits).count('1'):
+            board = board.copy()
+            board.set_position(self.board.o_bits, self.board.x_bits)
+        self.cancel_token = CancellationToken(time_budget)
+        self.search_thread = threading.Thread(target=self.search, args=(board, self.cancel_token), daemon=True)
+        self.search_thread.start()
+
+    def search(self, board, cancel_token):
+        '''
+        Runs on the search thread. Finds the turn and sends the answer.
+        '''
+        start_time = time.perf_counter()
+        turn = board.find_optimal_computer_turn(cancel_token)
+        info = [f'info time {round((time.perf_counter() - start_time)*1000)}',
+                f'complete {"true" if board.last_turn_complete else "false"}']
+        if board.last_option_scores != None:
+            list_of_options, scores = board.last_option_scores
+            score = scores[list_of_options.index(turn)]
+            if score != None:
+                info.append(f'score {score}')
+        if board.engine != None:
+            for key, value in board.engine.last_search.items():
+                if key == 'complete':
+                    continue
+                info.append(f'{key} {round(value, 3) if isinstance(value, float) else value}')
+        self.send(' '.join(info))
+        self.send(f'bestmove {turn[0] + 1} {turn[1] + 1}')
+
+    def command_stop(self, arguments):
+        if self.cancel_token != None:
+            self.cancel_token.cancel()
+        self.wait_for_search()
+
+    def run(self, input_lines=sys.stdin):
+        for line in input_lines:
+            if not self.handle(line):
+                break
+        self.command_stop([])
+
+if __name__ == '__main__':
+    EngineProtocol().run()
@@ -0,0 +1,35 @@
+
+'''
+The engines the computer can use to pick its turn, besides the permutation
+scoring built into Board. An engine is any object with a
+find_turn(board, cancel_token=None) method returning coordinates such as
+[1, 1], which stops early once the cancellation token expires (see
+cancellation.py). Engines keeping anything between turns also have a reset()
+method, to forget it, such as when they're given a new game. An engine's
+last_search is a dict summarising its last search, which has 'complete' set
+to False if the search was cut short by its budget or the token.
+'''
+
+from mcts_engine import MCTSEngine
+from negamax_engine import NegamaxEngine
+from threat_space_engine import ThreatSpaceEngine
+
+ENGINES = {
+    'negamax': NegamaxEngine,
+    'mcts': MCTSEngine,
+    'threats': ThreatSpaceEngine
+}
+
+def make_engine(engine):
+    '''
+    Returns an engine for Board. engine can be None or 'permutation' (use
+    Board's own permutation scoring, returns None), the name of an engine in
+    ENGINES (a new engine with default settings), or an engine object.
+    '''
+    if engine == None or engine == 'permutation':
+        return None
+    if isinstance(engine, str):
+        if engine not in ENGINES:
+            raise ValueError(f'Unknown engine {engine!r}, expected permutation or one of {", ".join(ENGINES)}')
+        return ENGINES[engine]()
+    return engine
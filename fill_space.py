@@ -0,0 +1,142 @@
+
+'''
+Enumeration of the possible future boards ("fills") of a simulated board.
+A fill puts an 'x' in (num_of_empty + 1)//2 of the empty coordinates and an
+'o' in the rest, so a fill is just a choice of which empty coordinates get an
+'x'. Fills are represented as bitmasks over the empty coordinates (bit j is set
+when the j-th empty coordinate, in row-major order, gets an 'x'), and are
+walked in combinatorial number system order, see:
+https://en.wikipedia.org/wiki/Combinatorial_number_system
+Because a fill can be ranked and unranked, any slice [start, stop) of the fill
+space can be generated without walking the fills before it.
+'''
+
+from math import comb
+
+def num_of_x_in_fill(num_of_empty):
+    '''
+    Returns how many of the empty coordinates get an 'x' in every fill. The
+    player always gets the extra turn when there is an odd number.
+    '''
+    return (num_of_empty + 1)//2
+
+def count_fills(num_of_empty):
+    '''
+    Returns how many fills there are for a board with the given number of empty
+    coordinates.
+    '''
+    return comb(num_of_empty, num_of_x_in_fill(num_of_empty))
+
+def rank_fill(fill):
+    '''
+    Returns the position of the given fill bitmask in combinatorial number
+    system order.
+    '''
+    rank = 0
+    num_of_bits_seen = 0
+    while fill:
+        lowest_bit = fill & -fill
+        num_of_bits_seen += 1
+        rank += comb(lowest_bit.bit_length() - 1, num_of_bits_seen)
+        fill ^= lowest_bit
+    return rank
+
+def unrank_fill(rank, num_of_x):
+    '''
+    Returns the fill bitmask with num_of_x bits set at the given position in
+    combinatorial number system order. The inverse of rank_fill().
+    '''
+    fill = 0
+    for i in range(num_of_x, 0, -1):
+        #Finds the largest position whose binomial coefficient fits in rank.
+        position = i - 1
+        while comb(position + 1, i) <= rank:
+            position += 1
+        fill |= 1 << position
+        rank -= comb(position, i)
+    return fill
+
+def next_fill(fill):
+    '''
+    Returns the fill bitmask after the given one, with the same number of bits
+    set, in combinatorial number system order (Gosper's hack).
+    '''
+    t = fill | (fill - 1)
+    return (t + 1) | (((~t & -~t) - 1) >> (fill & -fill).bit_length())
+
+def generate_fills(num_of_empty, start=0, stop=None):
+    '''
+    Lazily generates the fill bitmasks ranked [start, stop) for a board with
+    the given number of empty coordinates. Stop defaults to the end of the
+    fill space.
+    '''
+    total = count_fills(num_of_empty)
+    if stop == None or stop > total:
+        stop = total
+    if start >= stop:
+        return
+    num_of_x = num_of_x_in_fill(num_of_empty)
+    fill = unrank_fill(start, num_of_x)
+    yield fill
+    #With no 'x' to place there is only one fill, and no next fill.
+    if num_of_x == 0:
+        return
+    for i in range(stop - start - 1):
+        fill = next_fill(fill)
+        yield fill
+
+def build_fill_tables(empty_indices):
+    '''
+    Builds lookup tables that convert a fill bitmask into a bitboard of the
+    'x's it places. Table t maps bits [8*t, 8*t + 8) of a fill to bitboard bits,
+    so a fill converts with one lookup per byte instead of one step per
+    coordinate.
+    '''
+    tables = []
+    for table_start in range(0, len(empty_indices), 8):
+        chunk = empty_indices[table_start:table_start+8]
+        table = [0]*256
+        for byte in range(1, 256):
+            lowest_bit = byte & -byte
+            position = lowest_bit.bit_length() - 1
+            table[byte] = table[byte ^ lowest_bit]
+            if position < len(chunk):
+                table[byte] |= 1 << chunk[position]
+        tables.append(table)
+    return tables
+
+def tally_fills(geometry, x_bits, o_bits, empty_indices, start=0, stop=None):
+    '''
+    Goes through the fills ranked [start, stop) of the board given by x_bits
+    and o_bits, whose empty coordinates are the flat indices empty_indices in
+    row-major order. Returns (computer_wins, player_wins), the number of those
+    fills where the computer has a line and where the player has a line. A
+    fill where both have a line counts for both.
+    '''
+    empty_bits = 0
+    for index in empty_indices:
+        empty_bits |= 1 << index
+    tables = build_fill_tables(empty_indices)
+    has_line = geometry.has_line
+    computer_wins = 0
+    player_wins = 0
+    if len(tables) <= 3:
+        #Unrolled lookups for boards with up to 24 empty coordinates.
+        tables += [[0]*256 for i in range(3 - len(tables))]
+        table0, table1, table2 = tables
+        for fill in generate_fills(len(empty_indices), start, stop):
+            fill_x_bits = table0[fill & 255] | table1[fill >> 8 & 255] | table2[fill >> 16]
+            if has_line(o_bits | empty_bits ^ fill_x_bits):
+                computer_wins += 1
+            if has_line(x_bits | fill_x_bits):
+                player_wins += 1
+    else:
+        for fill in generate_fills(len(empty_indices), start, stop):
+            fill_x_bits = 0
+            for table_index, table in enumerate(tables):
+                fill_x_bits |= table[fill >> 8*table_index & 255]
+            if has_line(o_bits | empty_bits ^ fill_x_bits):
+                computer_wins += 1
+            if has_line(x_bits | fill_x_bits):
+                player_wins += 1
+    return computer_wins, player_wins
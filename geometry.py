@@ -0,0 +1,233 @@
+
+'''
+Index of everything about a board that only depends on its geometry, that is
+(num_of_rows, num_of_cols, required_in_a_row). Each index is built once and
+then shared by every board and game with the same geometry.
+Coordinates are stored as flat indices, (row_index*num_of_cols + col_index).
+'''
+
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1)) #E, S, SE, SW
+
+#The largest board (in spaces) the interface offers, since the computer's turn
+#gets slow past that. Rows and columns start at 3.
+MAX_BOARD_SPACES = 20
+MIN_BOARD_SIDE = 3
+#The largest board the interface offers by default. Boards past
+#MAX_BOARD_SPACES are played by the threat-space engine, see
+#threat_space_engine.py.
+MAX_HEURISTIC_BOARD_SPACES = 225
+
+_geometry_cache = {}
+
+class Geometry:
+    def __init__(self, num_of_rows, num_of_cols, required_in_a_row):
+        self.num_of_rows = num_of_rows
+        self.num_of_cols = num_of_cols
+        self.required_in_a_row = required_in_a_row
+        self.num_of_cells = num_of_rows*num_of_cols
+        self.full_bits = (1 << self.num_of_cells) - 1
+        #Flat index of the first coordinate of each row.
+        self.row_offsets = tuple(row_index*num_of_cols for row_index in range(num_of_rows))
+
+        #Every win line as a tuple of flat indices, and as a bitmask.
+        self.lines = self.generate_lines()
+        self.line_masks = [sum(1 << index for index in line) for line in self.lines]
+        #For every flat index, the indices (into self.lines) of the lines
+        #passing through it, and their bitmasks.
+        self.cell_lines = [[] for i in range(self.num_of_cells)]
+        for line_index, line in enumerate(self.lines):
+            for index in line:
+                self.cell_lines[index].append(line_index)
+        self.cell_line_masks = [[self.line_masks[line_index] for line_index in line_indices]
+                                for line_indices in self.cell_lines]
+
+        self.perimeter_indices = self.generate_perimeter_indices()
+
+        #Every rotation/reflection of the board that maps win lines onto win
+        #lines, as a tuple giving the new flat index of every flat index. The
+        #first symmetry is always the identity.
+        self.symmetries = self.generate_symmetries()
+        #Byte lookup tables for moving a whole bitboard through each symmetry.
+        self.symmetry_tables = [self.build_symmetry_tables(symmetry) for symmetry in self.symmetries]
+
+    def generate_lines(self):
+        '''
+        Generates every horizontal, vertical and diagonal run of
+        required_in_a_row coordinates that fits on the board.
+        '''
+        lines = []
+        for row in range(self.num_of_rows):
+            for col in range(self.num_of_cols):
+                for row_step, col_step in DIRECTIONS:
+                    end_row = row + row_step*(self.required_in_a_row-1)
+                    end_col = col + col_step*(self.required_in_a_row-1)
+                    if not (0 <= end_row < self.num_of_rows and 0 <= end_col < self.num_of_cols):
+                        continue
+                    line = tuple((row + row_step*i)*self.num_of_cols + col + col_step*i
+                                 for i in range(self.required_in_a_row))
+                    #With 1 in a row every direction gives the same line, so
+                    #only the first is kept.
+                    if self.required_in_a_row == 1 and (row_step, col_step) != DIRECTIONS[0]:
+                        continue
+                    lines.append(line)
+        return lines
+
+    def generate_perimeter_indices(self):
+        '''
+        Generates the flat indices that Board.subtract_scores_indices() treats
+        as the perimeter of the board: the left and right columns, plus the
+        first and last num_of_rows indices.
+        '''
+        perimeter_indices = set()
+        for i in range(0, self.num_of_cells, self.num_of_cols):
+            perimeter_indices.add(i) #Left
+            perimeter_indices.add(i-1+self.num_of_cols) #Right
+        for i in range(0, self.num_of_rows):
+            perimeter_indices.add(i) #Top
+            perimeter_indices.add(self.num_of_cells-1-i) #Bottom
+        return frozenset(perimeter_indices)
+
+    def generate_symmetries(self):
+        '''
+        Generates the symmetries of the board. Every board can be reflected
+        top to bottom and left to right, and rotated 180 degrees. Square boards
+        can also be rotated 90 degrees either way and reflected along both
+        diagonals.
+        '''
+        last_row = self.num_of_rows - 1
+        last_col = self.num_of_cols - 1
+        transforms = [
+            lambda row, col: (row, col),
+            lambda row, col: (last_row - row, col),
+            lambda row, col: (row, last_col - col),
+            lambda row, col: (last_row - row, last_col - col)
+        ]
+        if self.num_of_rows == self.num_of_cols:
+            transforms += [
+                lambda row, col: (col, row),
+                lambda row, col: (last_col - col, last_row - row),
+                lambda row, col: (col, last_row - row),
+                lambda row, col: (last_col - col, row)
+            ]
+        symmetries = []
+        for transform in transforms:
+            symmetry = []
+            for row in range(self.num_of_rows):
+                for col in range(self.num_of_cols):
+                    new_row, new_col = transform(row, col)
+                    symmetry.append(new_row*self.num_of_cols + new_col)
+            symmetry = tuple(symmetry)
+            #Boards with a single row or column have repeated symmetries.
+            if symmetry not in symmetries:
+                symmetries.append(symmetry)
+        return symmetries
+
+    def build_symmetry_tables(self, symmetry):
+        '''
+        Builds lookup tables that move a bitboard through the given symmetry.
+        Table t maps bits [8*t, 8*t + 8) of a bitboard to their new bits.
+        '''
+        tables = []
+        for table_start in range(0, self.num_of_cells, 8):
+            table = [0]*256
+            for byte in range(1, 256):
+                lowest_bit = byte & -byte
+                position = table_start + lowest_bit.bit_length() - 1
+                table[byte] = table[byte ^ lowest_bit]
+                if position < self.num_of_cells:
+                    table[byte] |= 1 << symmetry[position]
+            tables.append(table)
+        return tables
+
+    def transform_bits(self, bits, symmetry_index):
+        '''
+        Returns the bitboard moved through the symmetry with the given index
+        in self.symmetries.
+        '''
+        new_bits = 0
+        for table in self.symmetry_tables[symmetry_index]:
+            new_bits |= table[bits & 255]
+            bits >>= 8
+        return new_bits
+
+    def canonical_bits(self, x_bits, o_bits):
+        '''
+        Returns the canonical form of a board given as (x_bits, o_bits): the
+        smallest (x_bits, o_bits) out of all its symmetries. Boards that are
+        rotations or reflections of each other have the same canonical form.
+        '''
+        return min((self.transform_bits(x_bits, symmetry_index), self.transform_bits(o_bits, symmetry_index))
+                   for symmetry_index in range(len(self.symmetries)))
+
+    def canonicalize(self, x_bits, o_bits):
+        '''
+        Same as self.canonical_bits(), but also returns the index of the
+        symmetry that moves the board to its canonical form, as
+        (canonical_x_bits, canonical_o_bits, symmetry_index).
+        '''
+        return min((self.transform_bits(x_bits, symmetry_index), self.transform_bits(o_bits, symmetry_index), symmetry_index)
+                   for symmetry_index in range(len(self.symmetries)))
+
+    def find_stabilizer(self, x_bits, o_bits):
+        '''
+        Returns the indices (into self.symmetries) of the symmetries that leave
+        the board given as (x_bits, o_bits) unchanged. This always includes the
+        identity.
+        '''
+        return [symmetry_index for symmetry_index in range(len(self.symmetries))
+                if self.transform_bits(x_bits, symmetry_index) == x_bits
+                and self.transform_bits(o_bits, symmetry_index) == o_bits]
+
+    def orbit_representative(self, index, stabilizer):
+        '''
+        Returns the smallest flat index that the given flat index is moved to
+        by the symmetries in stabilizer. Moves on coordinates with the same
+        representative lead to boards that are symmetric to each other.
+        '''
+        return min(self.symmetries[symmetry_index][index] for symmetry_index in stabilizer)
+
+    def has_line(self, bits):
+        '''
+        Returns True if the given bitboard covers any win line.
+        '''
+        for mask in self.line_masks:
+            if bits & mask == mask:
+                return True
+        return False
+
+    def completes_line(self, bits, index):
+        '''
+        Returns True if the given bitboard covers a win line passing through
+        the given flat index. Only those lines need to be checked after a
+        single move at that index.
+        '''
+        for mask in self.cell_line_masks[index]:
+            if bits & mask == mask:
+                return True
+        return False
+
+def get_geometry(num_of_rows, num_of_cols, required_in_a_row):
+    '''
+    Returns the cached Geometry for the given board dimensions, building it
+    the first time it's asked for.
+    '''
+    key = (num_of_rows, num_of_cols, required_in_a_row)
+    geometry = _geometry_cache.get(key)
+    if geometry == None:
+        geometry = Geometry(num_of_rows, num_of_cols, required_in_a_row)
+        _geometry_cache[key] = geometry
+    return geometry
+
+def supported_geometries(max_board_spaces=MAX_BOARD_SPACES):
+    '''
+    Returns every (num_of_rows, num_of_cols, required_in_a_row) the interface
+    lets the user pick: at least MIN_BOARD_SIDE rows and columns, at most
+    max_board_spaces spaces, and from MIN_BOARD_SIDE up to the longer side in
+    a row to win.
+    '''
+    geometries = []
+    for num_of_rows in range(MIN_BOARD_SIDE, max_board_spaces//MIN_BOARD_SIDE + 1):
+        for num_of_cols in range(MIN_BOARD_SIDE, max_board_spaces//num_of_rows + 1):
+            for required_in_a_row in range(MIN_BOARD_SIDE, max(num_of_rows, num_of_cols) + 1):
+                geometries.append((num_of_rows, num_of_cols, required_in_a_row))
+    return geometries
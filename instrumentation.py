@@ -0,0 +1,112 @@
+
+'''
+Optional instrumentation for Board: counters for the work done on the hot
+paths (deep copies of the board, winner checks, including the two made for
+every fill scored, fills scored and permutations generated) and timings of
+each phase of the computer's turn. Boards have no instrumentation by default,
+which costs a single None check at each counted point.
+
+The scoring goes through the fills of each simulated board as combinations
+and plays its turns on the one board in place, so a turn scored that way only
+counts fills and winner checks. Deep copies and permutations are counted
+where the nested list board and generate_permutations() are still used.
+
+After each computer turn, a stats record (a dictionary) is kept on the board as
+board.last_move_stats and passed to the sink, if there is one. A sink is any
+function taking the record, such as a JSONLinesSink:
+    board = Board(3, 3, 3, instrumentation=Instrumentation(JSONLinesSink('moves.jsonl')))
+'''
+
+import json
+import time
+from collections import Counter
+
+#Phases of Board.find_optimal_computer_turn(), in the order they run.
+PHASES = (
+    'candidate_generation',
+    'instant_win_scan',
+    'block_scan',
+    'engine_search',
+    'opening_book',
+    'scoring',
+    'perimeter_adjustment'
+)
+
+class PhaseTimer:
+    __slots__ = ('instrumentation', 'phase', 'start_time')
+
+    def __init__(self, instrumentation, phase):
+        self.instrumentation = instrumentation
+        self.phase = phase
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.phase_seconds[self.phase] += time.perf_counter() - self.start_time
+        return False
+
+class Instrumentation:
+    def __init__(self, sink=None):
+        #Called with the stats record of every computer turn, or None.
+        self.sink = sink
+        #Counters and phase timings for the turn under way, and counters
+        #since the instrumentation was made.
+        self.counters = Counter()
+        self.phase_seconds = Counter()
+        self.totals = Counter()
+        self.start_time = None
+
+    def count(self, counter, amount=1):
+        '''
+        Adds amount to the counter, such as 'winner_checks'.
+        '''
+        self.counters[counter] += amount
+        self.totals[counter] += amount
+
+    def phase(self, phase):
+        '''
+        Returns a context manager that adds the time spent in it to the phase.
+        '''
+        return PhaseTimer(self, phase)
+
+    def start_move(self):
+        '''
+        Starts recording a computer turn.
+        '''
+        self.counters = Counter()
+        self.phase_seconds = Counter()
+        self.start_time = time.perf_counter()
+
+    def finish_move(self, board, turn):
+        '''
+        Finishes recording a computer turn on the board. Returns its stats
+        record, after passing it to the sink.
+        '''
+        record = {
+            'time': time.time(),
+            'geometry': [board.num_of_rows, board.num_of_cols, board.required_in_a_row],
+            'x_bits': board.x_bits,
+            'o_bits': board.o_bits,
+            'turn': list(turn),
+            'complete': board.last_turn_complete,
+            'seconds': time.perf_counter() - self.start_time,
+            'phases': {phase: self.phase_seconds[phase] for phase in PHASES if phase in self.phase_seconds},
+            'counters': dict(self.counters)
+        }
+        if self.sink != None:
+            self.sink(record)
+        return record
+
+class JSONLinesSink:
+    def __init__(self, path):
+        #Records are appended, one JSON object per line.
+        self.path = path
+        self.file = open(path, 'a')
+
+    def __call__(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,79 @@
+
+'''
+Per-win-line counts of each competitor's marks, kept up to date as marks are
+added and removed, so a move costs one update per line through its coordinate.
+From the counts it's known at all times which lines are complete (there is a
+winner) and which lines are one mark short with nothing of the other
+competitor's on them (a turn there wins, or has to be blocked), without
+scanning the board.
+'''
+
+class LineCounts:
+    def __init__(self, geometry):
+        self.geometry = geometry
+        num_of_lines = len(geometry.lines)
+        self.counts = {'x': [0]*num_of_lines, 'o': [0]*num_of_lines}
+        #Indices of the lines each competitor has completed, and of the lines
+        #where one more of their marks would complete them.
+        self.completed_lines = {'x': set(), 'o': set()}
+        self.threat_lines = {'x': set(), 'o': set()}
+        self.num_of_empty = geometry.num_of_cells
+        for line_index in range(num_of_lines):
+            self.update_line(line_index)
+
+    def update_line(self, line_index):
+        '''
+        Updates whether the line is complete, or one short, for each
+        competitor, from its counts.
+        '''
+        required_in_a_row = self.geometry.required_in_a_row
+        for competitor, other in (('x', 'o'), ('o', 'x')):
+            count = self.counts[competitor][line_index]
+            if count == required_in_a_row:
+                self.completed_lines[competitor].add(line_index)
+            else:
+                self.completed_lines[competitor].discard(line_index)
+            if count == required_in_a_row - 1 and self.counts[other][line_index] == 0:
+                self.threat_lines[competitor].add(line_index)
+            else:
+                self.threat_lines[competitor].discard(line_index)
+
+    def add_mark(self, index, competitor):
+        '''
+        Records a mark of competitor ('x' or 'o') at the flat index.
+        '''
+        counts = self.counts[competitor]
+        for line_index in self.geometry.cell_lines[index]:
+            counts[line_index] += 1
+            self.update_line(line_index)
+        self.num_of_empty -= 1
+
+    def remove_mark(self, index, competitor):
+        '''
+        Removes a mark of competitor ('x' or 'o') from the flat index.
+        '''
+        counts = self.counts[competitor]
+        for line_index in self.geometry.cell_lines[index]:
+            counts[line_index] -= 1
+            self.update_line(line_index)
+        self.num_of_empty += 1
+
+    def winner_exists(self, competitor='either'):
+        '''
+        Returns True if the competitor ('x', 'o' or 'either') has completed a
+        line.
+        '''
+        if competitor == 'either':
+            return bool(self.completed_lines['x'] or self.completed_lines['o'])
+        return bool(self.completed_lines[competitor])
+
+    def winning_indices(self, competitor, taken_bits):
+        '''
+        Returns the sorted flat indices where a mark of the competitor would
+        complete a line, given the bitboard of every taken coordinate.
+        '''
+        indices = set()
+        for line_index in self.threat_lines[competitor]:
+            empty_bits = self.geometry.line_masks[line_index] & ~taken_bits
+            indices.add(empty_bits.bit_length() - 1)
+        return sorted(indices)
@@ -0,0 +1,246 @@
+
+'''
+Anytime Monte Carlo Tree Search engine (UCT). Each playout walks down the tree
+picking the child with the best upper confidence bound, adds one new node,
+plays the rest of the game out at random (or with a light heuristic that takes
+wins and blocks threats) and records the result along the path. The more time
+it's given, the better it plays, and its cost doesn't depend on the number of
+empty coordinates, so it suits boards well past the permutation scoring's
+limit. The tree is kept between turns: the root moves down to the computer's
+turn, and then to the player's reply.
+'''
+
+import math
+import random
+import time
+
+#Results, from the point of view of the competitor who moved into a node.
+WIN, DRAW, LOSS = 1.0, 0.5, 0.0
+
+class MCTSNode:
+    __slots__ = ('index', 'parent', 'children', 'untried', 'wins', 'visits', 'result')
+
+    def __init__(self, index=None, parent=None):
+        #Flat index of the turn that led to this node.
+        self.index = index
+        self.parent = parent
+        self.children = []
+        #Flat indices not expanded into children yet, None until first visited.
+        self.untried = None
+        self.wins = 0.0
+        self.visits = 0
+        #WIN or DRAW if the game is over after this node's turn, else None.
+        self.result = None
+
+class MCTSEngine:
+    def __init__(self, time_limit_ms=1000, playouts=None, exploration=math.sqrt(2),
+                 playout_policy='random', seed=None):
+        #The search stops after time_limit_ms milliseconds or after the given
+        #number of playouts, whichever comes first. Either can be None.
+        self.time_limit_ms = time_limit_ms
+        self.playouts = playouts
+        self.exploration = exploration
+        #'random' plays out uniformly at random, 'light' takes wins and blocks
+        #the other competitor's wins when it can.
+        if playout_policy not in ('random', 'light'):
+            raise ValueError(f'Unknown playout policy {playout_policy!r}, expected random or light')
+        self.playout_policy = playout_policy
+        self.random = random.Random(seed)
+        #The root of the tree, the position (and geometry) it's for, and the
+        #competitor to move there ('o', the computer, or 'x').
+        self.root = None
+        self.root_bits = None
+        self.root_geometry = None
+        self.root_to_move = None
+        #Summary of the last search: playouts, seconds, playouts per second,
+        #how many playouts were reused from earlier turns, and whether it was
+        #complete (used its whole budget rather than being cancelled).
+        self.last_search = {}
+
+    def reset(self):
+        '''
+        Forgets the tree kept from earlier turns.
+        '''
+        self.root = None
+        self.root_bits = None
+        self.root_geometry = None
+        self.root_to_move = None
+
+    def find_turn(self, board, cancel_token=None):
+        '''
+        Returns the coordinates of the computer's turn on the board, such as
+        [1, 1]. The search also stops when the cancellation token expires.
+        '''
+        start_time = time.monotonic()
+        geometry = board.geometry
+        self.geometry = geometry
+        x_bits, o_bits = board.x_bits, board.o_bits
+        self.advance_root(x_bits, o_bits, 'o')
+        reused_playouts = self.root.visits
+
+        index = self.find_forced_turn(o_bits, x_bits)
+        num_of_playouts = 0
+        cancelled = False
+        if index == None:
+            deadline = None
+            if self.time_limit_ms != None:
+                deadline = start_time + self.time_limit_ms/1000
+            while self.playouts == None or num_of_playouts < self.playouts:
+                if deadline != None and time.monotonic() >= deadline:
+                    break
+                if cancel_token != None and cancel_token.expired():
+                    cancelled = True
+                    break
+                self.run_playout(o_bits, x_bits)
+                num_of_playouts += 1
+                if self.playouts == None and deadline == None and (cancel_token == None or cancel_token.deadline == None):
+                    break
+            #The most visited turn is the most trusted one.
+            if self.root.children:
+                index = max(self.root.children, key=lambda child: child.visits).index
+            else:
+                empty_bits = geometry.full_bits & ~(x_bits | o_bits)
+                index = (empty_bits & -empty_bits).bit_length() - 1
+
+        seconds = time.monotonic() - start_time
+        self.last_search = {
+            'playouts': num_of_playouts,
+            'seconds': seconds,
+            'playouts_per_second': num_of_playouts/seconds if seconds > 0 else 0.0,
+            'reused_playouts': reused_playouts,
+            'complete': not cancelled
+        }
+        self.advance_root(x_bits, o_bits | 1 << index, 'x')
+        return [index//geometry.num_of_cols, index%geometry.num_of_cols]
+
+    def advance_root(self, x_bits, o_bits, to_move):
+        '''
+        Moves the root of the tree to the given position, where to_move ('o'
+        or 'x') is the competitor to move, if it's one turn on from the current
+        root (keeping that part of the tree), otherwise starts a new tree.
+        '''
+        #A tree for another board can't be reused.
+        if self.root_geometry is not self.geometry:
+            self.reset()
+        if self.root != None:
+            root_x_bits, root_o_bits = self.root_bits
+            if (x_bits, o_bits) == self.root_bits and to_move == self.root_to_move:
+                return
+            #The children of the root are turns of the competitor to move
+            #there, so the one new mark has to be theirs. Who that is comes
+            #from the root itself, not from the counts of marks, since the
+            #computer doesn't always go first.
+            if self.root_to_move == 'o':
+                old_bits, new_bits, other_bits_unchanged = root_o_bits, o_bits, x_bits == root_x_bits
+            else:
+                old_bits, new_bits, other_bits_unchanged = root_x_bits, x_bits, o_bits == root_o_bits
+            added_bits = new_bits & ~old_bits
+            if (other_bits_unchanged and new_bits & old_bits == old_bits and to_move != self.root_to_move
+                    and added_bits and added_bits & (added_bits - 1) == 0):
+                index = added_bits.bit_length() - 1
+                for child in self.root.children:
+                    if child.index == index:
+                        child.parent = None
+                        self.root = child
+                        self.root_bits = (x_bits, o_bits)
+                        self.root_to_move = to_move
+                        return
+        self.root = MCTSNode()
+        self.root_bits = (x_bits, o_bits)
+        self.root_geometry = self.geometry
+        self.root_to_move = to_move
+
+    def find_forced_turn(self, my_bits, their_bits):
+        '''
+        Returns the flat index of a turn that wins, or else one that blocks
+        the other competitor's win, or None if there isn't one.
+        '''
+        geometry = self.geometry
+        empty_bits = geometry.full_bits & ~(my_bits | their_bits)
+        block_index = None
+        bits = empty_bits
+        while bits:
+            bit = bits & -bits
+            index = bit.bit_length() - 1
+            if geometry.completes_line(my_bits | bit, index):
+                return index
+            if block_index == None and geometry.completes_line(their_bits | bit, index):
+                block_index = index
+            bits ^= bit
+        return block_index
+
+    def run_playout(self, my_bits, their_bits):
+        '''
+        Runs one playout from the root, where my_bits are the marks of the
+        competitor to move.
+        '''
+        geometry = self.geometry
+        node = self.root
+        #Selection: walk down fully expanded nodes by upper confidence bound.
+        while node.result == None and node.untried == [] and node.children:
+            log_visits = math.log(node.visits)
+            best_value = -1.0
+            for child in node.children:
+                value = child.wins/child.visits + self.exploration*math.sqrt(log_visits/child.visits)
+                if value > best_value:
+                    best_value, best_child = value, child
+            node = best_child
+            my_bits, their_bits = their_bits, my_bits | 1 << node.index
+        #Expansion: add one untried turn.
+        if node.result == None:
+            if node.untried == None:
+                empty_bits = geometry.full_bits & ~(my_bits | their_bits)
+                node.untried = [index for index in range(geometry.num_of_cells) if empty_bits >> index & 1]
+                self.random.shuffle(node.untried)
+            if node.untried:
+                index = node.untried.pop()
+                child = MCTSNode(index, node)
+                node.children.append(child)
+                node = child
+                my_bits |= 1 << index
+                if geometry.completes_line(my_bits, index):
+                    child.result = WIN
+                elif my_bits | their_bits == geometry.full_bits:
+                    child.result = DRAW
+                my_bits, their_bits = their_bits, my_bits
+        #Simulation: play the rest of the game out.
+        if node.result != None:
+            result = node.result
+        else:
+            result = self.simulate(my_bits, their_bits)
+        #Backpropagation: each node records the result for the competitor who
+        #moved into it.
+        while node != None:
+            node.visits += 1
+            node.wins += result
+            result = 1.0 - result
+            node = node.parent
+
+    def simulate(self, my_bits, their_bits):
+        '''
+        Plays the game out from the position, where my_bits are the marks of
+        the competitor to move. Returns the result for the other competitor,
+        who moved last.
+        '''
+        geometry = self.geometry
+        empty_bits = geometry.full_bits & ~(my_bits | their_bits)
+        empty_indices = [index for index in range(geometry.num_of_cells) if empty_bits >> index & 1]
+        self.random.shuffle(empty_indices)
+        light = self.playout_policy == 'light'
+        #Flips every turn, so that it's True when the competitor who moved
+        #last before the playout is the one moving.
+        last_mover_to_move = False
+        while empty_indices:
+            index = None
+            if light:
+                index = self.find_forced_turn(my_bits, their_bits)
+                if index != None:
+                    empty_indices.remove(index)
+            if index == None:
+                index = empty_indices.pop()
+            my_bits |= 1 << index
+            if geometry.completes_line(my_bits, index):
+                return WIN if last_mover_to_move else LOSS
+            my_bits, their_bits = their_bits, my_bits
+            last_mover_to_move = not last_mover_to_move
+        return DRAW
@@ -0,0 +1,369 @@
+
+'''
+Local move service. An asyncio server on localhost that hosts many games at
+once and answers with the computer's turns, over a plain TCP protocol of one
+JSON object per line. Run it with:
+    python move_service.py --port 8765
+
+The searches themselves run on a bounded pool of worker processes, so the
+event loop never blocks on them:
+  - at most one search per worker runs at a time, the rest wait in a queue,
+    and once max_pending searches are waiting new ones are turned away
+    ('busy') rather than queued without limit;
+  - each request can give a deadline_ms, which covers its time in the queue;
+    the search is given whatever is left of it as its time budget, and plays
+    the best turn found so far when it runs out (see cancellation.py);
+  - identical searches asked for at the same time (same board, position and
+    options) share one search, as long as it's given at least as long as the
+    request that joins it, give or take COALESCE_TOLERANCE;
+  - boards are at most MAX_BOARD_SPACES spaces, or MAX_HEURISTIC_BOARD_SPACES
+    with an engine (see geometry.py), and are built off the event loop.
+
+Requests, each with an optional 'id' that is copied into the reply:
+    {"op": "new_session", "rows": 3, "cols": 3, "k": 3, "engine": null, "scorer": "enumerate"}
+        -> {"session": <session id>}
+    {"op": "play", "session": <id>, "row": 1, "col": 1}
+        -> {"winner": "player" or null, "full": false}
+    {"op": "move", "session": <id>, "deadline_ms": 1000}
+        -> {"row": 2, "col": 2, "complete": true, "winner": "computer" or null, "full": false}
+    {"op": "query", "rows": 3, "cols": 3, "k": 3, "cells": "x___o____", "deadline_ms": 1000}
+        -> {"row": 1, "col": 3, "complete": true}
+    {"op": "close_session", "session": <id>}
+    {"op": "stats"}
+        -> queue depth, searches running, sessions, counters and latency percentiles
+Rows and columns start at 1, and cells are given row by row as in
+engine_protocol.py. Replies have "ok": true, or "ok": false and an "error".
+'''
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmark import summarise
+from dynamic_tictactoe import Board
+from engine_protocol import parse_cells
+from engines import ENGINES
+from geometry import MAX_BOARD_SPACES, MAX_HEURISTIC_BOARD_SPACES
+from scorers import SCORERS
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_PENDING = 64
+#Latencies kept for the stats.
+LATENCY_WINDOW = 1000
+#Time allowed past a deadline for the search to notice its budget has run out
+#and answer.
+DEADLINE_GRACE = 0.25
+#How much earlier than a request's deadline a search under way can stop and
+#still be shared with it. Identical requests sent together arrive a little
+#apart, so their deadlines are never quite the same.
+COALESCE_TOLERANCE = 0.1
+#Largest request line accepted.
+MAX_LINE_BYTES = 65536
+
+class ServiceError(Exception):
+    pass
+
+#Boards kept by each worker process, one per (geometry, engine, scorer), so
+#the tables behind them stay warm between searches.
+_worker_boards = {}
+
+def search_position(geometry_key, x_bits, o_bits, engine, scorer, time_budget):
+    '''
+    Worker side of the service. Returns ([row_index, col_index], complete) for
+    the computer's turn in the position.
+    '''
+    key = (geometry_key, engine, scorer)
+    board = _worker_boards.get(key)
+    if board == None:
+        num_of_rows, num_of_cols, required_in_a_row = geometry_key
+        board = Board(required_in_a_row, num_of_rows, num_of_cols, scorer=scorer, engine=engine)
+        board.show_progress = False
+        _worker_boards[key] = board
+    board.set_position(x_bits, o_bits)
+    turn = board.find_optimal_computer_turn(time_budget=time_budget)
+    return turn, board.last_turn_complete
+
+class Session:
+    def __init__(self, board, engine, scorer):
+        self.board = board
+        self.engine = engine
+        self.scorer = scorer
+        #Only one request changes a session at a time.
+        self.lock = asyncio.Lock()
+
+class MoveService:
+    def __init__(self, workers=None, max_pending=DEFAULT_MAX_PENDING):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.worker_slots = asyncio.Semaphore(self.workers)
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+        #Searches under way, by (geometry, x_bits, o_bits, engine, scorer), so
+        #identical ones can share them, as (task, deadline).
+        self.searches = {}
+        self.queue_depth = 0
+        self.running = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {'requests': 0, 'searches': 0, 'coalesced': 0, 'rejected': 0,
+                         'deadline_exceeded': 0, 'errors': 0}
+
+    async def find_turn(self, geometry_key, x_bits, o_bits, engine, scorer, deadline):
+        '''
+        Returns (turn, complete) for the position, sharing the search with
+        any identical one under way. deadline is a loop.time(), or None.
+        '''
+        key = (geometry_key, x_bits, o_bits, engine, scorer)
+        search, search_deadline = self.searches.get(key, (None, None))
+        #A search stopping well before this request's deadline would answer
+        #it with less than it asked for, so only a search given about as long
+        #is shared.
+        if search != None and (search_deadline == None
+                               or (deadline != None and deadline <= search_deadline + COALESCE_TOLERANCE)):
+            self.counters['coalesced'] += 1
+        else:
+            if self.queue_depth >= self.max_pending:
+                self.counters['rejected'] += 1
+                raise ServiceError('busy')
+            #Counted as waiting from now, not from when the task first runs, so
+            #a burst of requests can't all slip past the limit.
+            self.queue_depth += 1
+            search = asyncio.ensure_future(self.run_search(key, deadline))
+            self.searches[key] = (search, deadline)
+            search.add_done_callback(lambda done: self.searches.pop(key)
+                                     if self.searches.get(key, (None,))[0] is done else None)
+        remaining = None if deadline == None else deadline - asyncio.get_running_loop().time()
+        try:
+            return await asyncio.wait_for(asyncio.shield(search),
+                                          None if remaining == None else max(0.0, remaining) + DEADLINE_GRACE)
+        except asyncio.TimeoutError:
+            self.counters['deadline_exceeded'] += 1
+            raise ServiceError('deadline exceeded')
+
+    async def run_search(self, key, deadline):
+        '''
+        Waits for a free worker, then runs the search on it with whatever is
+        left of the deadline as its time budget.
+        '''
+        geometry_key, x_bits, o_bits, engine, scorer = key
+        loop = asyncio.get_running_loop()
+        try:
+            await self.worker_slots.acquire()
+        finally:
+            self.queue_depth -= 1
+        try:
+            time_budget = None
+            if deadline != None:
+                time_budget = deadline - loop.time()
+                if time_budget <= 0:
+                    self.counters['deadline_exceeded'] += 1
+                    raise ServiceError('deadline exceeded')
+            self.running += 1
+            self.counters['searches'] += 1
+            try:
+                return await loop.run_in_executor(self.executor, search_position, geometry_key,
+                                                  x_bits, o_bits, engine, scorer, time_budget)
+            finally:
+                self.running -= 1
+        finally:
+            self.worker_slots.release()
+
+    def get_session(self, request):
+        session = self.sessions.get(request.get('session'))
+        if session == None:
+            raise ServiceError('unknown session')
+        return session
+
+    def make_deadline(self, request):
+        deadline_ms = request.get('deadline_ms')
+        if deadline_ms == None:
+            return None
+        return asyncio.get_running_loop().time() + float(deadline_ms)/1000
+
+    async def handle_request(self, request):
+        '''
+        Handles one request and returns the reply's fields.
+        '''
+        op = request.get('op')
+        if op == 'new_session':
+            engine, scorer = get_search_options(request)
+            board = await make_board(request, engine)
+            session_id = next(self.session_ids)
+            self.sessions[session_id] = Session(board, engine, scorer)
+            return {'session': session_id}
+        if op == 'close_session':
+            self.sessions.pop(request.get('session'), None)
+            return {}
+        if op == 'play':
+            session = self.get_session(request)
+            async with session.lock:
+                board = session.board
+                check_game_not_over(board)
+                if bin(board.x_bits).count('1') >= bin(board.o_bits).count('1'):
+                    raise ServiceError("it's the computer's turn")
+                row, col = int(request['row']) - 1, int(request['col']) - 1
+                if not (0 <= row < board.num_of_rows and 0 <= col < board.num_of_cols) \
+                        or (board.x_bits | board.o_bits) >> (row*board.num_of_cols + col) & 1:
+                    raise ServiceError('invalid turn')
+                board.apply_player_turn(row, col)
+                return {'winner': 'player' if board.check_if_winner_exists(competitor='player') else None,
+                        'full': board.check_if_full_board()}
+        if op == 'move':
+            session = self.get_session(request)
+            deadline = self.make_deadline(request)
+            async with session.lock:
+                board = session.board
+                check_game_not_over(board)
+                if bin(board.x_bits).count('1') != bin(board.o_bits).count('1'):
+                    raise ServiceError("it's the player's turn")
+                turn, complete = await self.find_turn(geometry_key(board), board.x_bits, board.o_bits,
+                                                      session.engine, session.scorer, deadline)
+                board.apply_computer_turn(turn)
+                return {'row': turn[0] + 1, 'col': turn[1] + 1, 'complete': complete,
+                        'winner': 'computer' if board.check_if_winner_exists(competitor='computer') else None,
+                        'full': board.check_if_full_board()}
+        if op == 'query':
+            engine, scorer = get_search_options(request)
+            board = await make_board(request, engine)
+            try:
+                x_bits, o_bits = parse_cells(request.get('cells', ''), board.geometry)
+            except ValueError as error:
+                raise ServiceError(str(error))
+            board.set_position(x_bits, o_bits)
+            check_game_not_over(board)
+            if bin(x_bits).count('1') != bin(o_bits).count('1'):
+                raise ServiceError("o moves first, so it's only o's turn when the counts are equal")
+            turn, complete = await self.find_turn(geometry_key(board), x_bits, o_bits, engine, scorer,
+                                                  self.make_deadline(request))
+            return {'row': turn[0] + 1, 'col': turn[1] + 1, 'complete': complete}
+        if op == 'stats':
+            return self.stats()
+        raise ServiceError(f'unknown op {op!r}')
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'running': self.running,
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'sessions': len(self.sessions),
+            'counters': dict(self.counters),
+            'latency': summarise(self.latencies) if self.latencies else None
+        }
+
+    async def handle_connection(self, reader, writer):
+        '''
+        Serves one client, one request line at a time, so a client that sends
+        faster than its requests are answered is slowed down by TCP itself.
+        '''
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    break
+                if not line:
+                    break
+                reply = await self.handle_line(line)
+                writer.write((json.dumps(reply) + '\n').encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_line(self, line):
+        start_time = time.perf_counter()
+        self.counters['requests'] += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ServiceError('requests must be JSON objects')
+            request_id = request.get('id')
+            reply = {'ok': True}
+            reply.update(await self.handle_request(request))
+        except (ServiceError, ValueError, KeyError, TypeError) as error:
+            self.counters['errors'] += 1
+            reply = {'ok': False, 'error': str(error) if isinstance(error, ServiceError) else f'bad request: {error}'}
+        if request_id != None:
+            reply['id'] = request_id
+        self.latencies.append(time.perf_counter() - start_time)
+        return reply
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE_BYTES)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+def geometry_key(board):
+    return (board.num_of_rows, board.num_of_cols, board.required_in_a_row)
+
+async def make_board(request, engine):
+    '''
+    Returns an empty board for the geometry of a request, searched with the
+    given engine. The board is built on a thread, since building a geometry
+    for the first time can take a while.
+    '''
+    num_of_rows, num_of_cols, required_in_a_row = int(request['rows']), int(request['cols']), int(request['k'])
+    if min(num_of_rows, num_of_cols, required_in_a_row) < 1:
+        raise ServiceError('rows, cols and k must be at least 1')
+    max_board_spaces = MAX_BOARD_SPACES if engine in (None, 'permutation') else MAX_HEURISTIC_BOARD_SPACES
+    if num_of_rows*num_of_cols > max_board_spaces:
+        raise ServiceError(f'boards are limited to {max_board_spaces} spaces'
+                           + (' without an engine' if max_board_spaces == MAX_BOARD_SPACES else ''))
+    return await asyncio.to_thread(build_board, num_of_rows, num_of_cols, required_in_a_row)
+
+def build_board(num_of_rows, num_of_cols, required_in_a_row):
+    board = Board(required_in_a_row, num_of_rows, num_of_cols, opening_book=None, transposition_table=None)
+    board.show_progress = False
+    return board
+
+def get_search_options(request):
+    '''
+    Returns the (engine, scorer) names of a request, checking they exist.
+    '''
+    engine = request.get('engine')
+    scorer = request.get('scorer', 'enumerate')
+    if engine not in (None, 'permutation') and engine not in ENGINES:
+        raise ServiceError(f'unknown engine {engine!r}')
+    if scorer not in SCORERS:
+        raise ServiceError(f'unknown scorer {scorer!r}')
+    return engine, scorer
+
+def check_game_not_over(board):
+    if board.check_if_winner_exists() or board.check_if_full_board():
+        raise ServiceError('the game is over')
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves the computer player to many games at once on localhost.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on')
+    parser.add_argument('--workers', type=int, default=None, help='search processes (default: one per core)')
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                        help='searches allowed to wait for a worker before new ones are turned away')
+    args = parser.parse_args()
+
+    async def run():
+        service = MoveService(args.workers, args.max_pending)
+        print(f'Serving on {args.host}:{args.port} with {service.workers} worker(s)')
+        try:
+            await service.serve(args.host, args.port)
+        finally:
+            service.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
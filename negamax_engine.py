@@ -0,0 +1,248 @@
+
+'''
+Exact game-tree search engine: negamax with alpha-beta pruning, a
+transposition table, move ordering and iterative deepening under a depth and
+time budget. Unlike the permutation scoring, it plays out the actual turns of
+the game, so it finds forced wins and losses, and its cost is bounded by its
+budget rather than by the number of empty coordinates.
+
+Scores are from the point of view of the competitor to move. A win is worth
+WIN_SCORE minus the number of turns it takes, so faster wins (and slower
+losses) are preferred; a full board is worth 0. Positions at the depth limit
+are scored by an evaluation function, by default line_evaluation().
+'''
+
+import time
+
+WIN_SCORE = 1000000
+#Scores within this much of WIN_SCORE are wins/losses rather than evaluations.
+WIN_THRESHOLD = WIN_SCORE - 1000
+#Weight of a line holding n of a competitor's marks and none of the other's.
+LINE_WEIGHTS = [0, 1, 8, 64, 512, 4096, 32768, 262144]
+#How often (in nodes) the clock and cancellation token are checked, by default.
+CLOCK_CHECK_INTERVAL = 1024
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+class SearchTimeout(Exception):
+    pass
+
+def line_evaluation(geometry, my_bits, their_bits):
+    '''
+    Scores a position for the competitor to move by counting, for every win
+    line, how many marks each competitor has on it if the other has none.
+    '''
+    score = 0
+    for mask in geometry.line_masks:
+        mine = my_bits & mask
+        theirs = their_bits & mask
+        if mine and not theirs:
+            score += LINE_WEIGHTS[min(bin(mine).count('1'), len(LINE_WEIGHTS) - 1)]
+        elif theirs and not mine:
+            score -= LINE_WEIGHTS[min(bin(theirs).count('1'), len(LINE_WEIGHTS) - 1)]
+    return score
+
+class NegamaxEngine:
+    def __init__(self, max_depth=None, time_limit=1.0, evaluate=line_evaluation,
+                 max_table_entries=1000000):
+        #Deepest search in turns (None searches to the end of the game), and
+        #the time budget in seconds for a turn (None for no limit).
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.evaluate = evaluate
+        self.max_table_entries = max_table_entries
+        #Nodes searched between checks of the clock and cancellation token.
+        #Engines with costlier nodes check more often, to keep to their budget.
+        self.clock_check_interval = CLOCK_CHECK_INTERVAL
+        #(geometry, my_bits, their_bits) -> (depth, flag, score, best_index).
+        #Kept between turns, since positions don't change meaning. The
+        #geometry is part of the key, since the same bitboards are different
+        #positions on boards of different sizes, and one engine can be given
+        #to many boards.
+        self.table = {}
+        self.deadline = None
+        self.cancel_token = None
+        self.nodes = 0
+        #Summary of the last search: depth completed, score, nodes, seconds,
+        #and whether it was complete (searched as deep as it was allowed to,
+        #or found a forced result) rather than stopped by its budget.
+        self.last_search = {}
+
+    def reset(self):
+        '''
+        Forgets everything learnt from earlier searches.
+        '''
+        self.table.clear()
+
+    def find_turn(self, board, cancel_token=None):
+        '''
+        Returns the coordinates of the computer's turn on the board, such as
+        [1, 1]. If the cancellation token expires, the best turn of the
+        deepest completed search is returned.
+        '''
+        start_time = time.monotonic()
+        geometry = board.geometry
+        self.geometry = geometry
+        self.nodes = 0
+        self.deadline = None if self.time_limit == None else start_time + self.time_limit
+        self.cancel_token = cancel_token
+        if len(self.table) > self.max_table_entries:
+            self.table.clear()
+
+        my_bits, their_bits = board.o_bits, board.x_bits
+        empty_bits = geometry.full_bits & ~(my_bits | their_bits)
+        num_of_empty = bin(empty_bits).count('1')
+        max_depth = num_of_empty if self.max_depth == None else min(self.max_depth, num_of_empty)
+        best_index = self.generate_moves(my_bits, their_bits, empty_bits, None)[0]
+        completed_depth = 0
+        best_score = 0
+        #Iterative deepening: each depth reuses the table filled by the last,
+        #and the best turn of the deepest completed search is played.
+        for depth in range(1, max_depth + 1):
+            try:
+                best_score, best_index = self.search_root(my_bits, their_bits, empty_bits, depth, best_index)
+            except SearchTimeout:
+                break
+            completed_depth = depth
+            #A forced win or loss has been found, searching deeper won't change it.
+            if abs(best_score) >= WIN_THRESHOLD:
+                break
+        self.last_search = {
+            'depth': completed_depth,
+            'score': best_score,
+            'nodes': self.nodes,
+            'seconds': time.monotonic() - start_time,
+            'complete': completed_depth == max_depth or abs(best_score) >= WIN_THRESHOLD
+        }
+        return [best_index//geometry.num_of_cols, best_index%geometry.num_of_cols]
+
+    def order_moves(self, my_bits, their_bits, empty_bits, table_index):
+        '''
+        Returns the empty flat indices in the order they should be searched:
+        the table's best turn first, then turns that win, then turns that
+        block the other competitor's win, then the rest by how many win lines
+        pass through them.
+        '''
+        geometry = self.geometry
+        scored_moves = []
+        index = 0
+        bits = empty_bits
+        while bits:
+            if bits & 1:
+                if index == table_index:
+                    priority = 4
+                elif geometry.completes_line(my_bits | 1 << index, index):
+                    priority = 3
+                elif geometry.completes_line(their_bits | 1 << index, index):
+                    priority = 2
+                else:
+                    priority = 0
+                scored_moves.append((priority, len(geometry.cell_lines[index]), -index, index))
+            bits >>= 1
+            index += 1
+        scored_moves.sort(reverse=True)
+        return [move[3] for move in scored_moves]
+
+    def generate_moves(self, my_bits, their_bits, empty_bits, table_index):
+        '''
+        Returns the flat indices worth searching, in order. A winning turn is
+        returned on its own, and if the other competitor can win next turn,
+        only blocking them is worth searching.
+        '''
+        geometry = self.geometry
+        moves = self.order_moves(my_bits, their_bits, empty_bits, table_index)
+        for index in moves:
+            if geometry.completes_line(my_bits | 1 << index, index):
+                return [index]
+        for index in moves:
+            if geometry.completes_line(their_bits | 1 << index, index):
+                return [index]
+        return moves
+
+    def search_root(self, my_bits, their_bits, empty_bits, depth, previous_best_index):
+        '''
+        Searches every turn of the root position to the given depth. Returns
+        (best_score, best_index).
+        '''
+        alpha, beta = -WIN_SCORE - 1, WIN_SCORE + 1
+        best_score = -WIN_SCORE - 1
+        best_index = previous_best_index
+        for index in self.generate_moves(my_bits, their_bits, empty_bits, previous_best_index):
+            score = self.search_move(my_bits, their_bits, empty_bits, index, depth, alpha, beta, 0)
+            if score > best_score:
+                best_score, best_index = score, index
+            alpha = max(alpha, score)
+        self.table[(self.geometry, my_bits, their_bits)] = (depth, EXACT, best_score, best_index)
+        return best_score, best_index
+
+    def search_move(self, my_bits, their_bits, empty_bits, index, depth, alpha, beta, ply):
+        '''
+        Returns the score of the competitor to move taking the given flat
+        index, from their point of view.
+        '''
+        bit = 1 << index
+        new_my_bits = my_bits | bit
+        if self.geometry.completes_line(new_my_bits, index):
+            return WIN_SCORE - (ply + 1)
+        return -self.negamax(their_bits, new_my_bits, empty_bits & ~bit, depth - 1, -beta, -alpha, ply + 1)
+
+    def negamax(self, my_bits, their_bits, empty_bits, depth, alpha, beta, ply):
+        '''
+        Returns the score of the position for the competitor to move, whose
+        marks are my_bits, searching depth more turns.
+        '''
+        self.nodes += 1
+        if self.nodes%self.clock_check_interval == 0:
+            if self.deadline != None and time.monotonic() > self.deadline:
+                raise SearchTimeout
+            if self.cancel_token != None and self.cancel_token.expired():
+                raise SearchTimeout
+        if empty_bits == 0:
+            return 0
+        if depth == 0:
+            return self.evaluate(self.geometry, my_bits, their_bits)
+
+        original_alpha = alpha
+        table_index = None
+        entry = self.table.get((self.geometry, my_bits, their_bits))
+        if entry != None:
+            entry_depth, flag, score, table_index = entry
+            if entry_depth >= depth:
+                #Win/loss scores are stored relative to the position.
+                if score >= WIN_THRESHOLD:
+                    score -= ply
+                elif score <= -WIN_THRESHOLD:
+                    score += ply
+                if flag == EXACT:
+                    return score
+                if flag == LOWER_BOUND:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+
+        moves = self.generate_moves(my_bits, their_bits, empty_bits, table_index)
+        best_score = -WIN_SCORE - 1
+        best_index = moves[0]
+        for index in moves:
+            score = self.search_move(my_bits, their_bits, empty_bits, index, depth, alpha, beta, ply)
+            if score > best_score:
+                best_score, best_index = score, index
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        stored_score = best_score
+        if stored_score >= WIN_THRESHOLD:
+            stored_score += ply
+        elif stored_score <= -WIN_THRESHOLD:
+            stored_score -= ply
+        self.table[(self.geometry, my_bits, their_bits)] = (depth, flag, stored_score, best_index)
+        return best_score
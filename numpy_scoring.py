@@ -0,0 +1,85 @@
+
+'''
+NumPy version of fill_space.tally_fills(). Fills are built a chunk at a time as
+a 0/1 matrix (one row per fill, one column per empty coordinate) and multiplied
+against the geometry's coordinate-by-win-line incidence matrix, which gives
+how many of each line's empty coordinates every fill gives to the player. From
+that it can be read off whether the computer, the player or both complete a
+line, for the whole chunk at once. Memory is bounded by the chunk size.
+'''
+
+from math import comb
+
+from fill_space import count_fills, num_of_x_in_fill
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Number of fills evaluated per matrix multiplication.
+DEFAULT_CHUNK_SIZE = 16384
+
+_incidence_cache = {}
+
+def get_incidence_matrix(geometry):
+    '''
+    Returns the (num_of_cells x num_of_lines) 0/1 matrix of which coordinates
+    belong to which win lines, built once per geometry.
+    '''
+    key = (geometry.num_of_rows, geometry.num_of_cols, geometry.required_in_a_row)
+    #Looked up by key, since comparing an array to None is done elementwise.
+    if key not in _incidence_cache:
+        incidence = np.zeros((geometry.num_of_cells, len(geometry.lines)), dtype=np.float32)
+        for line_index, line in enumerate(geometry.lines):
+            incidence[list(line), line_index] = 1
+        _incidence_cache[key] = incidence
+    return _incidence_cache[key]
+
+def tally_fills_numpy(geometry, x_bits, o_bits, empty_indices, start=0, stop=None, chunk_size=None):
+    '''
+    Same as fill_space.tally_fills(), using batched NumPy evaluation. Returns
+    (computer_wins, player_wins) for the fills ranked [start, stop).
+    '''
+    if np == None:
+        raise ImportError('The numpy scorer requires NumPy to be installed.')
+    if chunk_size == None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    num_of_empty = len(empty_indices)
+    num_of_x = num_of_x_in_fill(num_of_empty)
+    total = count_fills(num_of_empty)
+    if stop == None or stop > total:
+        stop = total
+    if start >= stop or len(geometry.lines) == 0:
+        return 0, 0
+
+    incidence = get_incidence_matrix(geometry)
+    x_cells = np.array([x_bits >> index & 1 for index in range(geometry.num_of_cells)], dtype=np.float32)
+    o_cells = np.array([o_bits >> index & 1 for index in range(geometry.num_of_cells)], dtype=np.float32)
+    empty_incidence = incidence[empty_indices]
+    #A fill gives the player `counts` of a line's empty coordinates, and the
+    #computer the rest. The player completes the line when that tops up their
+    #marks already on it to required_in_a_row, and the computer does when it
+    #leaves exactly enough for the computer's marks to do the same.
+    player_target = geometry.required_in_a_row - x_cells @ incidence
+    computer_target = o_cells @ incidence + empty_incidence.sum(axis=0) - geometry.required_in_a_row
+
+    #Tables for turning ranks back into fills, one per remaining 'x', as in
+    #fill_space.unrank_fill(): rank_tables[i][c] = comb(c, i).
+    rank_tables = {i: np.array([comb(c, i) for c in range(num_of_empty)], dtype=np.int64)
+                   for i in range(1, num_of_x + 1)}
+
+    computer_wins = 0
+    player_wins = 0
+    for chunk_start in range(start, stop, chunk_size):
+        ranks = np.arange(chunk_start, min(chunk_start + chunk_size, stop), dtype=np.int64)
+        rows = np.arange(len(ranks))
+        placed = np.zeros((len(ranks), num_of_empty), dtype=np.float32)
+        for i in range(num_of_x, 0, -1):
+            positions = np.searchsorted(rank_tables[i], ranks, side='right') - 1
+            placed[rows, positions] = 1
+            ranks -= rank_tables[i][positions]
+        counts = placed @ empty_incidence
+        computer_wins += int((counts == computer_target).any(axis=1).sum())
+        player_wins += int((counts == player_target).any(axis=1).sum())
+    return computer_wins, player_wins
@@ -0,0 +1,239 @@
+
+'''
+On-disk opening book. The early positions of a game on a given geometry are
+the same every time, so their scores can be worked out once, offline, and
+looked up instead of being generated at the start of every game.
+
+There is one book file per geometry, named book_<rows>x<cols>_k<to win>.bin.
+A file is a 16 byte header followed by fixed size records sorted by key, so a
+lookup is a binary search over the memory-mapped file and opening a book costs
+next to nothing:
+    header: magic b'DTTB', version (u16), rows, cols, to win (u8 each),
+            3 padding bytes, number of records (u32)
+    record: key (u64), best move (u8), 3 padding bytes, then a score (i32)
+            for every flat index of the board
+The key is (o_bits << 32 | x_bits) of the position in canonical form (see
+Geometry.canonical_bits()), and the best move and scores are in the canonical
+form's coordinates. Scores are the raw scores of each option, before the
+perimeter adjustment, with NO_SCORE for taken coordinates. Only positions where
+the computer has to score its options are stored.
+
+To build books, run this file, for example:
+    python opening_book.py --rows 4 --cols 5 --to-win 4
+    python opening_book.py --all --depth 3
+'''
+
+import argparse
+import contextlib
+import io
+import mmap
+import os
+import struct
+
+from geometry import get_geometry, supported_geometries
+from parallel_scoring import get_scoring_pool, resolve_workers
+
+MAGIC = b'DTTB'
+VERSION = 1
+HEADER = struct.Struct('<4sHBBB3xI')
+KEY = struct.Struct('<Q')
+NO_SCORE = -2**31
+NO_MOVE = 255
+#Keys hold each bitboard in 32 bits.
+MAX_BOOK_CELLS = 32
+
+DEFAULT_BOOK_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening_books')
+#Number of player turns after the computer's first turn covered by a book.
+DEFAULT_DEPTH = 2
+
+def book_filename(num_of_rows, num_of_cols, required_in_a_row):
+    '''
+    Returns the file name of the book for the given geometry.
+    '''
+    return f'book_{num_of_rows}x{num_of_cols}_k{required_in_a_row}.bin'
+
+def record_struct(num_of_cells):
+    '''
+    Returns the struct of a record for a board with the given number of cells.
+    '''
+    return struct.Struct(f'<QB3x{num_of_cells}i')
+
+class OpeningBook:
+    def __init__(self, directory=DEFAULT_BOOK_DIRECTORY):
+        self.directory = directory
+        #For each geometry, (mmap, number of records, record struct), or None
+        #if there is no book for it.
+        self.books = {}
+        self.hits = 0
+        self.misses = 0
+
+    def open_book(self, geometry):
+        '''
+        Returns the memory-mapped book for the geometry, opening it the first
+        time it's asked for. Returns None if there is no book for it.
+        '''
+        key = (geometry.num_of_rows, geometry.num_of_cols, geometry.required_in_a_row)
+        if key in self.books:
+            return self.books[key]
+        book = None
+        path = os.path.join(self.directory, book_filename(*key))
+        if geometry.num_of_cells <= MAX_BOOK_CELLS and os.path.exists(path):
+            with open(path, 'rb') as book_file:
+                book_mmap = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, num_of_rows, num_of_cols, required_in_a_row, num_of_records = \
+                HEADER.unpack_from(book_mmap, 0)
+            if magic != MAGIC or version != VERSION or (num_of_rows, num_of_cols, required_in_a_row) != key:
+                book_mmap.close()
+                raise ValueError(f'{path} is not a version {VERSION} opening book for {key}')
+            book = (book_mmap, num_of_records, record_struct(geometry.num_of_cells))
+        self.books[key] = book
+        return book
+
+    def lookup(self, geometry, x_bits, o_bits):
+        '''
+        Returns the raw score of every flat index of the board (None for taken
+        coordinates) if the book has the position, or a rotation/reflection of
+        it. Otherwise, returns None.
+        '''
+        book = self.open_book(geometry)
+        if book == None:
+            self.misses += 1
+            return None
+        book_mmap, num_of_records, record = book
+        canonical_x_bits, canonical_o_bits, symmetry_index = geometry.canonicalize(x_bits, o_bits)
+        key = canonical_o_bits << 32 | canonical_x_bits
+        #Binary search for the key.
+        low, high = 0, num_of_records
+        while low < high:
+            middle = (low + high)//2
+            middle_key = KEY.unpack_from(book_mmap, HEADER.size + middle*record.size)[0]
+            if middle_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == num_of_records or KEY.unpack_from(book_mmap, HEADER.size + low*record.size)[0] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        canonical_scores = record.unpack_from(book_mmap, HEADER.size + low*record.size)[2:]
+        #Moves the scores back from the canonical form's coordinates.
+        symmetry = geometry.symmetries[symmetry_index]
+        cell_scores = []
+        for index in range(geometry.num_of_cells):
+            score = canonical_scores[symmetry[index]]
+            cell_scores.append(None if score == NO_SCORE else score)
+        return cell_scores
+
+    def close(self):
+        '''
+        Closes every open book. Books are opened again when next looked up.
+        '''
+        for book in self.books.values():
+            if book != None:
+                book[0].close()
+        self.books = {}
+
+def write_book(path, geometry, entries):
+    '''
+    Writes a book file for the geometry. entries maps canonical
+    (x_bits, o_bits) to (best_index, cell_scores), where cell_scores has a
+    score, or None, for every flat index.
+    '''
+    record = record_struct(geometry.num_of_cells)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as book_file:
+        book_file.write(HEADER.pack(MAGIC, VERSION, geometry.num_of_rows, geometry.num_of_cols,
+                                    geometry.required_in_a_row, len(entries)))
+        for key, x_bits, o_bits in sorted((o_bits << 32 | x_bits, x_bits, o_bits) for x_bits, o_bits in entries):
+            best_index, cell_scores = entries[(x_bits, o_bits)]
+            book_file.write(record.pack(key, best_index,
+                                        *[NO_SCORE if score == None else score for score in cell_scores]))
+    os.replace(temporary_path, path)
+
+def analyse_position(geometry_key, x_bits, o_bits):
+    '''
+    Worker side of build_book(). Works out the computer's turn for the
+    position as Board.find_optimal_computer_turn() would, without the book.
+    Returns (best_index, cell_scores), where cell_scores is None if the turn
+    didn't need scoring.
+    '''
+    from dynamic_tictactoe import Board
+    num_of_rows, num_of_cols, required_in_a_row = geometry_key
+    board = Board(required_in_a_row, num_of_rows, num_of_cols, opening_book=None)
+    board.set_position(x_bits, o_bits)
+    immediate_turn = board.find_immediate_computer_turn()
+    if immediate_turn != None:
+        return immediate_turn[0]*num_of_cols + immediate_turn[1], None
+    list_of_options = board.generate_all_computer_options()
+    with contextlib.redirect_stdout(io.StringIO()):
+        scores = board.generate_option_scores(list_of_options)
+    best_option = board.choose_option_from_scores(list_of_options, scores)
+    cell_scores = [None]*board.geometry.num_of_cells
+    for option, score in zip(list_of_options, scores):
+        cell_scores[option[0]*num_of_cols + option[1]] = score
+    return best_option[0]*num_of_cols + best_option[1], cell_scores
+
+def build_book(num_of_rows, num_of_cols, required_in_a_row, depth=DEFAULT_DEPTH,
+               workers=None, directory=DEFAULT_BOOK_DIRECTORY):
+    '''
+    Builds the book for a geometry, covering every position reached when the
+    computer plays its best turns and the player replies anywhere, for up to
+    depth player turns. Positions are analysed on the scoring pool, one per
+    worker at a time. Returns the number of positions stored.
+    '''
+    geometry = get_geometry(num_of_rows, num_of_cols, required_in_a_row)
+    if geometry.num_of_cells > MAX_BOOK_CELLS:
+        raise ValueError(f'Opening books only support boards of up to {MAX_BOOK_CELLS} spaces')
+    pool = get_scoring_pool(resolve_workers(workers))
+    geometry_key = (num_of_rows, num_of_cols, required_in_a_row)
+    entries = {}
+    #Positions (in canonical form) where it's the computer's turn.
+    positions = {(0, 0)}
+    for level in range(depth + 1):
+        futures = [(position, pool.submit(analyse_position, geometry_key, *position))
+                   for position in sorted(positions)]
+        next_positions = set()
+        for (x_bits, o_bits), future in futures:
+            best_index, cell_scores = future.result()
+            if cell_scores != None:
+                entries[(x_bits, o_bits)] = (best_index, cell_scores)
+            if level == depth:
+                continue
+            o_bits |= 1 << best_index
+            if geometry.has_line(o_bits) or x_bits | o_bits == geometry.full_bits:
+                continue
+            for index in range(geometry.num_of_cells):
+                if (x_bits | o_bits) >> index & 1:
+                    continue
+                next_x_bits = x_bits | 1 << index
+                if geometry.has_line(next_x_bits) or next_x_bits | o_bits == geometry.full_bits:
+                    continue
+                next_positions.add(geometry.canonical_bits(next_x_bits, o_bits))
+        positions = next_positions
+    os.makedirs(directory, exist_ok=True)
+    write_book(os.path.join(directory, book_filename(*geometry_key)), geometry, entries)
+    return len(entries)
+
+#Shared by every Board, so each book is only opened once.
+default_opening_book = OpeningBook()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds opening books for the computer player.')
+    parser.add_argument('--rows', type=int, help='number of rows of the board')
+    parser.add_argument('--cols', type=int, help='number of columns of the board')
+    parser.add_argument('--to-win', type=int, help='number required in a row to win')
+    parser.add_argument('--all', action='store_true', help='build a book for every geometry the interface offers')
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH, help='number of player turns to cover')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: one per core)')
+    parser.add_argument('--directory', default=DEFAULT_BOOK_DIRECTORY, help='where to write the books')
+    args = parser.parse_args()
+    if args.all:
+        geometries = supported_geometries()
+    elif args.rows and args.cols and args.to_win:
+        geometries = [(args.rows, args.cols, args.to_win)]
+    else:
+        parser.error('either --all, or --rows, --cols and --to-win are required')
+    for num_of_rows, num_of_cols, required_in_a_row in geometries:
+        num_of_positions = build_book(num_of_rows, num_of_cols, required_in_a_row,
+                                      args.depth, args.workers, args.directory)
+        print(f'{num_of_rows}x{num_of_cols}, {required_in_a_row} in a row: {num_of_positions} positions')
@@ -0,0 +1,164 @@
+
+'''
+Scores simulated boards on a pool of worker processes. The pool is created the
+first time it's needed and then kept for every turn and game after that, so
+worker start up (and each worker's geometry cache) is only paid for once.
+'''
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from cancellation import POLL_INTERVAL
+
+from fill_space import count_fills, tally_fills
+from geometry import get_geometry
+
+#Every scoring request is cut into about this many shards per worker, so that
+#workers that finish early can pick up more work.
+SHARDS_PER_WORKER = 4
+#Shards smaller than this aren't worth the cost of sending them to a worker.
+MIN_SHARD_SIZE = 2000
+
+_pool = None
+_pool_workers = None
+
+def resolve_workers(workers):
+    '''
+    Returns the number of worker processes to use. None means one per core.
+    '''
+    if workers == None:
+        return os.cpu_count() or 1
+    return max(1, workers)
+
+def get_scoring_pool(workers=None):
+    '''
+    Returns the persistent scoring pool, creating it if it doesn't exist yet,
+    or replacing it if it was created with a different number of workers.
+    '''
+    global _pool, _pool_workers
+    workers = resolve_workers(workers)
+    if _pool != None and _pool_workers != workers:
+        shutdown_scoring_pool()
+    if _pool == None:
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+def shutdown_scoring_pool():
+    '''
+    Shuts down the persistent scoring pool, if there is one. The next call to
+    get_scoring_pool() starts a new one.
+    '''
+    global _pool, _pool_workers
+    if _pool != None:
+        _pool.shutdown()
+    _pool = None
+    _pool_workers = None
+
+def split_fill_space(num_of_fills, num_of_shards):
+    '''
+    Splits the fills ranked [0, num_of_fills) into at most num_of_shards
+    contiguous [start, stop) ranges of (nearly) equal size.
+    '''
+    num_of_shards = max(1, min(num_of_shards, num_of_fills))
+    return [(num_of_fills*i//num_of_shards, num_of_fills*(i+1)//num_of_shards)
+            for i in range(num_of_shards)]
+
+def tally_shard(tally, geometry_key, x_bits, o_bits, empty_indices, start, stop):
+    '''
+    Worker side of the scoring pool. Returns the (computer_wins, player_wins)
+    tally for the fills ranked [start, stop) of the given simulated board,
+    using the given scorer's tally function (see scorers.py).
+    '''
+    return tally(get_geometry(*geometry_key), x_bits, o_bits, empty_indices, start, stop)
+
+def submit_shards(pool, geometry, x_bits, o_bits, shard_size, tally):
+    '''
+    Splits the fill space of a simulated board into shards of about
+    shard_size fills and submits each shard to the pool. Returns the futures.
+    '''
+    geometry_key = (geometry.num_of_rows, geometry.num_of_cols, geometry.required_in_a_row)
+    taken_bits = x_bits | o_bits
+    empty_indices = [index for index in range(geometry.num_of_cells) if not taken_bits >> index & 1]
+    num_of_fills = count_fills(len(empty_indices))
+    num_of_shards = -(-num_of_fills//max(1, shard_size))
+    return [pool.submit(tally_shard, tally, geometry_key, x_bits, o_bits, empty_indices, start, stop)
+            for start, stop in split_fill_space(num_of_fills, num_of_shards)]
+
+def cancel_futures(futures):
+    '''
+    Cancels every given shard future that hasn't started yet. Shards already
+    running finish, and their results are ignored.
+    '''
+    for future in futures:
+        future.cancel()
+
+def merge_tallies(futures, cancel_token=None):
+    '''
+    Waits for the given shard futures and returns the score made from their
+    merged tallies. If the cancellation token expires first, cancels the
+    shards left and returns None.
+    '''
+    if cancel_token != None:
+        pending = set(futures)
+        while pending:
+            if cancel_token.expired():
+                cancel_futures(pending)
+                return None
+            done, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+    computer_wins = 0
+    player_wins = 0
+    for future in futures:
+        shard_computer_wins, shard_player_wins = future.result()
+        computer_wins += shard_computer_wins
+        player_wins += shard_player_wins
+    return computer_wins - player_wins
+
+def score_simulation(geometry, x_bits, o_bits, workers=None, tally=tally_fills, cancel_token=None):
+    '''
+    Scores a single simulated board by splitting its fill space across the
+    scoring pool, SHARDS_PER_WORKER shards per worker. Returns the same score
+    as Board.generate_score_for_simulation(), or None if the cancellation
+    token expires first.
+    '''
+    workers = resolve_workers(workers)
+    pool = get_scoring_pool(workers)
+    taken_bits = x_bits | o_bits
+    num_of_empty = geometry.num_of_cells - bin(taken_bits).count('1')
+    shard_size = max(MIN_SHARD_SIZE, -(-count_fills(num_of_empty)//(workers*SHARDS_PER_WORKER)))
+    return merge_tallies(submit_shards(pool, geometry, x_bits, o_bits, shard_size, tally), cancel_token)
+
+def score_simulations(geometry, simulations, workers=None, tally=tally_fills, cancel_token=None):
+    '''
+    Sends every simulated board, given as (x_bits, o_bits) pairs, to the
+    scoring pool and returns an iterator over their scores, in the same order
+    as the simulations. The fill spaces of all the simulations are cut into
+    shards of the same size, so the workers stay evenly loaded even when
+    there are only a few simulations, or they differ in cost. If the
+    cancellation token expires, every shard left is cancelled and the
+    iterator yields None and stops.
+    '''
+    workers = resolve_workers(workers)
+    pool = get_scoring_pool(workers)
+    total_fills = 0
+    for x_bits, o_bits in simulations:
+        num_of_empty = geometry.num_of_cells - bin(x_bits | o_bits).count('1')
+        total_fills += count_fills(num_of_empty)
+    shard_size = max(MIN_SHARD_SIZE, -(-total_fills//(workers*SHARDS_PER_WORKER)))
+    futures = [submit_shards(pool, geometry, x_bits, o_bits, shard_size, tally)
+               for x_bits, o_bits in simulations]
+    return collect_scores(futures, cancel_token)
+
+def collect_scores(futures, cancel_token=None):
+    '''
+    Yields the score of each simulation's shard futures in order, see
+    score_simulations().
+    '''
+    for num, simulation_futures in enumerate(futures):
+        score = merge_tallies(simulation_futures, cancel_token)
+        if score == None:
+            for later_futures in futures[num + 1:]:
+                cancel_futures(later_futures)
+            yield None
+            return
+        yield score
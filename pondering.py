@@ -0,0 +1,130 @@
+
+'''
+Pondering: working out the computer's replies while the player is thinking.
+Once the computer has taken its turn, a background thread goes through the
+player's possible turns, most likely first, and finds the computer's turn for
+each one into a reply cache. When the player takes their turn, the computer's
+reply is then either ready straight away, or (if it was being pondered) the
+search already under way is waited for. Any other search is stopped, but the
+simulated boards it scored are already in the transposition table, so the
+computer's turn resumes from that work rather than starting over.
+
+Engines keep their own state between turns, so only boards using the
+permutation scoring are pondered.
+'''
+
+import threading
+
+from cancellation import CancellationToken
+
+class Ponderer:
+    def __init__(self, max_replies=None):
+        #Most player turns pondered after each computer turn, None for all of
+        #them (best for small boards).
+        self.max_replies = max_replies
+        #(x_bits, o_bits) after a player turn -> the computer's reply.
+        self.reply_cache = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.cancel_token = None
+        #Position being pondered right now, and whether to stop pondering once
+        #it's done.
+        self.current_position = None
+        self.finish_current = False
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, board):
+        '''
+        Starts pondering the player's turns on the board in the background,
+        stopping any pondering already under way.
+        '''
+        self.stop()
+        self.reply_cache = {}
+        if board.engine != None or board.check_if_winner_exists() or board.check_if_full_board():
+            return
+        ponder_board = board.copy()
+        ponder_board.show_progress = False
+        self.cancel_token = CancellationToken()
+        self.finish_current = False
+        self.thread = threading.Thread(target=self.ponder, args=(ponder_board, self.cancel_token), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        '''
+        Stops pondering and waits for the background thread to finish.
+        '''
+        #May be called from more than one thread at once.
+        thread, cancel_token = self.thread, self.cancel_token
+        if thread != None:
+            cancel_token.cancel()
+            thread.join()
+            self.thread = None
+
+    def order_replies(self, board):
+        '''
+        Returns the flat indices of the player's possible turns, most likely
+        first: winning, then blocking the computer's win, then by the number of
+        win lines through them.
+        '''
+        taken_bits = board.x_bits | board.o_bits
+        win_indices = set(board.line_counts.winning_indices('x', taken_bits))
+        block_indices = set(board.line_counts.winning_indices('o', taken_bits))
+        replies = [index for index in range(board.geometry.num_of_cells) if not taken_bits >> index & 1]
+        replies.sort(key=lambda index: (index not in win_indices, index not in block_indices,
+                                        -len(board.geometry.cell_lines[index]), index))
+        if self.max_replies != None:
+            replies = replies[:self.max_replies]
+        return replies
+
+    def ponder(self, board, cancel_token):
+        '''
+        Background thread. Finds the computer's reply to each of the player's
+        turns in order, until cancelled.
+        '''
+        for index in self.order_replies(board):
+            if cancel_token.expired():
+                break
+            board.make_move(index, 'x')
+            position = (board.x_bits, board.o_bits)
+            with self.lock:
+                self.current_position = position
+            if not board.check_if_winner_exists() and not board.check_if_full_board():
+                turn = board.find_optimal_computer_turn(cancel_token)
+                if board.last_turn_complete:
+                    with self.lock:
+                        self.reply_cache[position] = turn
+            board.undo_move()
+            with self.lock:
+                self.current_position = None
+                if self.finish_current:
+                    break
+
+    def find_turn(self, board, cancel_token=None):
+        '''
+        Returns the computer's turn on the board, as
+        board.find_optimal_computer_turn() would, using the pondered reply if
+        there is one.
+        '''
+        position = (board.x_bits, board.o_bits)
+        with self.lock:
+            turn = self.reply_cache.get(position)
+            if turn == None and self.current_position == position:
+                #It's being pondered right now, so let it finish.
+                self.finish_current = True
+        thread = self.thread
+        if turn == None and thread != None and self.finish_current:
+            while thread.is_alive():
+                if cancel_token != None and cancel_token.expired():
+                    break
+                thread.join(0.02)
+            with self.lock:
+                turn = self.reply_cache.get(position)
+        self.stop()
+        self.reply_cache = {}
+        if turn != None:
+            self.hits += 1
+            board.last_turn_complete = True
+            return turn
+        self.misses += 1
+        return board.find_optimal_computer_turn(cancel_token)
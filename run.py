@@ -1,10 +1,14 @@
 
 import tkinter as tk
+import argparse
+import queue
 import sys
-import time
 from threading import Thread
 
+from cancellation import CancellationToken
 from dynamic_tictactoe import *
+from geometry import MAX_BOARD_SPACES, MAX_HEURISTIC_BOARD_SPACES, MIN_BOARD_SIDE
+from pondering import Ponderer
 
 # Define aesthetic interface constants
 BACKGROUND_COLOR = "white"
@@ -23,6 +27,24 @@ BUTTON_WIDTH = 17
 PLAYER_COLOR = "#00d95e"
 COMPUTER_COLOR = "#d9005a"
 
+# How often (in milliseconds) the interface picks up progress and turns from
+# the computer's worker thread, about the display's refresh rate
+DISPLAY_INTERVAL_MS = 33
+
+# Boards with more spaces than MAX_BOARD_SPACES are too big for the computer to
+# score every future board, so it plays them with this engine instead
+LARGE_BOARD_ENGINE = "threats"
+
+# Boards are drawn as a grid of buttons, or on a single canvas, which stays
+# quick to open and update however big the board is. "auto" uses the canvas for
+# boards with more spaces than MAX_BOARD_SPACES
+RENDERERS = ("auto", "buttons", "canvas")
+# Largest size (in pixels) of a board drawn on the canvas, and the largest and
+# smallest size of each of its spaces
+CANVAS_BOARD_SIZE = 600
+CANVAS_SPACE_SIZE = 120
+CANVAS_MIN_SPACE_SIZE = 24
+
 def common_title(text):
     '''
     A label object with all consistent aesthetic features for titles used in the
@@ -140,10 +162,66 @@ def common_popup(title, message):
     ).pack()
     popup.mainloop()
 
+class CanvasBoard:
+    '''
+    The game board drawn on a single canvas. Opening it draws only the grid
+    lines, and each mark is drawn when it's placed, as items tagged with its
+    space's index, so drawing a turn costs the same however big the board
+    is. Clicks are turned into spaces by arithmetic.
+    '''
+    def __init__(self, num_of_rows, num_of_cols, command):
+        self.num_of_rows = num_of_rows
+        self.num_of_cols = num_of_cols
+        self.space_size = max(CANVAS_MIN_SPACE_SIZE,
+                              min(CANVAS_SPACE_SIZE, CANVAS_BOARD_SIZE//max(num_of_rows, num_of_cols)))
+        # Called with the index of the space clicked
+        self.command = command
+        self.width = num_of_cols*self.space_size
+        self.height = num_of_rows*self.space_size
+        self.canvas = tk.Canvas(
+            window,
+            width=self.width,
+            height=self.height,
+            bg=TEXTBOX_COLOR,
+            highlightthickness=0
+        )
+        for row_num in range(1, num_of_rows):
+            self.canvas.create_line(0, row_num*self.space_size, self.width, row_num*self.space_size,
+                                    fill=BACKGROUND_COLOR, width=3)
+        for col_num in range(1, num_of_cols):
+            self.canvas.create_line(col_num*self.space_size, 0, col_num*self.space_size, self.height,
+                                    fill=BACKGROUND_COLOR, width=3)
+        self.canvas.bind("<Button-1>", self.click)
+
+    def click(self, event):
+        row_index = event.y//self.space_size
+        col_index = event.x//self.space_size
+        if 0 <= row_index < self.num_of_rows and 0 <= col_index < self.num_of_cols:
+            self.command(row_index*self.num_of_cols + col_index)
+
+    def mark_space(self, space_index, text, color):
+        '''
+        Draws (or redraws) a single space, with its mark.
+        '''
+        tag = f"space{space_index}"
+        self.canvas.delete(tag)
+        x = space_index%self.num_of_cols*self.space_size
+        y = space_index//self.num_of_cols*self.space_size
+        self.canvas.create_rectangle(x + 2, y + 2, x + self.space_size - 1, y + self.space_size - 1,
+                                     fill=color, width=0, tags=(tag,))
+        self.canvas.create_text(x + self.space_size//2, y + self.space_size//2, text=text,
+                                font=(FONT, max(8, self.space_size//3)), fill=TEXT_COLOR_HIGHLIGHT, tags=(tag,))
+
 class Interface:
-    def __init__(self, window, geometry, title, bg):
+    def __init__(self, window, geometry, title, bg, max_board_spaces=MAX_HEURISTIC_BOARD_SPACES,
+                 renderer="auto"):
         # Define interface object for the application
         self.window = window
+        # The largest board (in spaces) that can be picked, and how the game
+        # board is drawn, one of RENDERERS
+        self.max_board_spaces = max_board_spaces
+        self.renderer = renderer
+        self.canvas_board = None
         # Define list which tracks of all tkinter objects being displayed
         # on the interface (so that they can be removed when necessary)
         self.drawn_elements = []
@@ -154,7 +232,22 @@ class Interface:
 
         self.board = None
 
-        self.kill_all_threads = False
+        # Cancelled when the game is left, which stops the computer's turn
+        # being calculated for it
+        self.cancel_token = CancellationToken()
+
+        # Works out the computer's replies while the player is thinking
+        self.ponderer = Ponderer()
+
+        # The computer's turns are worked out on a single worker thread, which
+        # takes (board, cancel token) jobs and sends progress and turns back
+        # through a queue, read by the main loop
+        self.computer_thinking = False
+        self.last_reported_progress = None
+        self.computer_jobs = queue.Queue()
+        self.computer_events = queue.Queue()
+        Thread(target=self.run_computer_worker, daemon=True).start()
+        window.after(DISPLAY_INTERVAL_MS, self.process_computer_events)
 
         # Set properties of interface
         window.geometry(geometry)
@@ -173,7 +266,7 @@ class Interface:
             common_button("To Win: 3", lambda: self.change_to_win()),
             common_button("START GAME", lambda: self.draw_game_board()),
             common_button("Quit", lambda: self.quit_interface()),
-            common_title("*Maximum 20 board spaces allowed (9/20)")
+            common_title(self.board_spaces_text())
         ]
 
         # Define tkinter elements for the game page
@@ -206,7 +299,8 @@ class Interface:
         '''
         Changes all elements on the interface to display main menu page.
         '''
-        self.kill_all_threads = True
+        self.cancel_token.cancel()
+        self.ponderer.stop()
         self.clear_all()
         self.drawn_elements = []
 
@@ -233,7 +327,7 @@ class Interface:
         '''
         Changes all elements on the interface to display game board.
         '''
-        self.kill_all_threads = False
+        self.cancel_token = CancellationToken()
         self.clear_all()
         self.drawn_elements = []
 
@@ -247,6 +341,12 @@ class Interface:
             text=f"Objective: {self.num_to_win} in a row!",
         )
 
+        if self.uses_canvas():
+            self.draw_canvas_board()
+            self.start_game()
+            return
+        self.canvas_board = None
+
         window.geometry(f"{self.num_of_cols*125}x{self.num_of_rows*155}")
 
         num_of_spaces = self.num_of_cols*self.num_of_rows
@@ -292,10 +392,61 @@ class Interface:
 
         self.start_game()
 
+    def uses_canvas(self):
+        if self.renderer == "auto":
+            return self.num_of_rows*self.num_of_cols > MAX_BOARD_SPACES
+        return self.renderer == "canvas"
+
+    def draw_canvas_board(self):
+        '''
+        Lays out the game page with the board drawn on a single canvas, see
+        CanvasBoard.
+        '''
+        self.canvas_board = CanvasBoard(self.num_of_rows, self.num_of_cols, self.take_player_turn)
+
+        window.geometry(f"{max(450, self.canvas_board.width + 6)}x{self.canvas_board.height + 170}")
+
+        self.canvas_board.canvas.grid(
+            padx=3,
+            pady=3,
+            row=0,
+            column=0
+        )
+        self.drawn_elements.append(self.canvas_board.canvas)
+        window.grid_rowconfigure(0, weight=1)
+
+        for index, elmt in enumerate(self.game_board_additional_elements):
+            elmt.grid(
+                padx=3,
+                pady=3,
+                row=1+index,
+                column=0,
+                sticky="nsew"
+            )
+            window.grid_rowconfigure(1+index, weight=0)
+            self.drawn_elements.append(elmt)
+        window.grid_columnconfigure(0, weight=1)
+
+    def mark_space(self, space_index, text, color):
+        '''
+        Shows a mark on a space of the game board, however it's drawn.
+        '''
+        if self.canvas_board != None:
+            self.canvas_board.mark_space(space_index, text, color)
+        else:
+            self.game_board_elements[space_index].configure(
+                text=text,
+                bg=color
+            )
+
     # FUNCTIONS THAT REACT TO USER INTERACTION
 
+    def board_spaces_text(self):
+        return f"*Maximum {self.max_board_spaces} board spaces allowed " \
+               f"({self.num_of_cols*self.num_of_rows}/{self.max_board_spaces})"
+
     def change_rows(self):
-        if (self.num_of_rows+1)*self.num_of_cols > 20:
+        if (self.num_of_rows+1)*self.num_of_cols > self.max_board_spaces:
             self.num_of_rows = 3
         else:
             self.num_of_rows += 1
@@ -305,11 +456,11 @@ class Interface:
         )
 
         self.main_menu_elements[6].config(
-            text=f"*Maximum 20 board spaces allowed ({self.num_of_cols*self.num_of_rows}/20)"
+            text=self.board_spaces_text()
         )
 
     def change_cols(self):
-        if (self.num_of_cols+1)*self.num_of_rows > 20:
+        if (self.num_of_cols+1)*self.num_of_rows > self.max_board_spaces:
             self.num_of_cols = 3
         else:
             self.num_of_cols += 1
@@ -319,7 +470,7 @@ class Interface:
         )
 
         self.main_menu_elements[6].config(
-            text=f"*Maximum 20 board spaces allowed ({self.num_of_cols*self.num_of_rows}/20)"
+            text=self.board_spaces_text()
         )
 
     def change_to_win(self):
@@ -333,50 +484,84 @@ class Interface:
             text=f"To Win: {self.num_to_win}"
         )
 
-    def refresh_progress(self):
-
-        if self.board.check_if_winner_exists() or self.board.check_if_full_board():
-            return
-
+    def show_progress(self, progress):
+        '''
+        Shows the progress of the computer's turn, as a percentage.
+        '''
         self.game_board_additional_elements[1].configure(
-            text=f"Computer's turn! - Calculating...0%",
+            text=f"Computer's turn! - Calculating...{round(progress)}%",
             fg=TEXT_COLOR
         )
 
-        self.board.progress = 0
-        check_change = 0
-        while (not self.board.check_if_winner_exists() and
-                not self.board.check_if_full_board() and
-                self.board.flatten_board().count("x") ==
-                self.board.flatten_board().count("o") and
-                not self.kill_all_threads):
-            print("is looping")
-            if check_change < self.board.progress:
-                check_change = self.board.progress
-                self.game_board_additional_elements[1].configure(
-                    text=f"Computer's turn! - Calculating...{round(self.board.progress)}%",
-                    fg=TEXT_COLOR
-                )
-                window.update_idletasks()
-            time.sleep(0.25)
+    # FUNCTIONS THAT PASS WORK BETWEEN THE INTERFACE AND THE COMPUTER
 
-        self.game_board_additional_elements[1].configure(
-            text=f"Your turn!",
-            fg=TEXT_COLOR
-        )
-
-    def take_computer_turn(self):
+    def run_computer_worker(self):
+        '''
+        Runs on the worker thread for the life of the application, working out
+        each computer turn that is asked for and sending the result back to
+        the main loop. It never touches the interface itself.
+        '''
+        while True:
+            board, cancel_token = self.computer_jobs.get()
+            # The game may be left while the turn is being calculated, in
+            # which case the search stops early and its turn is thrown away
+            computer_turn = self.ponderer.find_turn(board, cancel_token)
+            if not cancel_token.cancelled:
+                self.computer_events.put(("turn", cancel_token, computer_turn))
+
+    def report_progress(self, cancel_token, progress):
+        '''
+        Called by the board (on the worker thread) as the computer's turn
+        progresses. Only whole percentage changes are sent on.
+        '''
+        if round(progress) != self.last_reported_progress:
+            self.last_reported_progress = round(progress)
+            self.computer_events.put(("progress", cancel_token, progress))
 
-        #Thread(target=self.refresh_progress).start()
+    def process_computer_events(self):
+        '''
+        Runs on the main loop every DISPLAY_INTERVAL_MS, applying whatever the
+        worker has sent since. Only the latest progress is shown.
+        '''
+        progress = None
+        while True:
+            try:
+                event, cancel_token, value = self.computer_events.get_nowait()
+            except queue.Empty:
+                break
+            # Ignore anything sent for a game that has been left
+            if cancel_token is not self.cancel_token or cancel_token.cancelled:
+                continue
+            if event == "progress":
+                progress = value
+            else:
+                progress = None
+                self.apply_computer_turn(value)
+        if progress != None and self.computer_thinking:
+            self.show_progress(progress)
+        self.window.after(DISPLAY_INTERVAL_MS, self.process_computer_events)
 
-        computer_turn = self.board.find_optimal_computer_turn()
+    def take_computer_turn(self):
+        '''
+        Asks the worker for the computer's turn on the current board.
+        '''
+        self.computer_thinking = True
+        self.last_reported_progress = None
+        self.show_progress(0)
+        cancel_token = self.cancel_token
+        self.board.progress_callback = lambda progress: self.report_progress(cancel_token, progress)
+        self.computer_jobs.put((self.board, cancel_token))
+
+    def apply_computer_turn(self, computer_turn):
+        '''
+        Applies the computer's turn worked out by the worker to the board and
+        the interface.
+        '''
+        self.computer_thinking = False
         self.board.apply_computer_turn(computer_turn)
 
         space_index = computer_turn[0]*self.num_of_cols + computer_turn[1]
-        self.game_board_elements[space_index].configure(
-            text="o",
-            bg=COMPUTER_COLOR
-        )
+        self.mark_space(space_index, "o", COMPUTER_COLOR)
 
         if self.board.check_if_winner_exists():
             self.game_board_additional_elements[1].configure(
@@ -389,12 +574,20 @@ class Interface:
                 text="It's a draw!!!",
                 fg=TEXT_COLOR
             )
+        else:
+            self.game_board_additional_elements[1].configure(
+                text=f"Your turn!",
+                fg=TEXT_COLOR
+            )
+            self.ponderer.start(self.board)
+
+    # FUNCTIONS THAT REACT TO USER INTERACTION DURING A GAME
 
     def take_player_turn(self, space_index):
         #The player can always "take their turn", but their actions are only
         #registered when the computer has completed its turn
-        flattened_board = self.board.flatten_board()
-        if flattened_board.count("x") == flattened_board.count("o") or flattened_board[space_index] != "_" or self.board.check_if_winner_exists():
+        taken_bits = self.board.x_bits | self.board.o_bits
+        if self.computer_thinking or taken_bits >> space_index & 1 or self.board.check_if_winner_exists():
             return
 
         column_index = int(space_index%self.num_of_cols)
@@ -402,45 +595,50 @@ class Interface:
 
         self.board.apply_player_turn(row_index, column_index)
 
-        self.game_board_elements[space_index].configure(
-            text="x",
-            bg=PLAYER_COLOR
-        )
-        window.update_idletasks()
+        self.mark_space(space_index, "x", PLAYER_COLOR)
 
         if self.board.check_if_winner_exists():
+            # The game is over, so there is no reply to ponder
+            self.ponderer.stop()
             self.game_board_additional_elements[1].configure(
                 text="You won!!!",
                 bg=PLAYER_COLOR,
                 fg=TEXT_COLOR_HIGHLIGHT
             )
         elif self.board.check_if_full_board():
+            self.ponderer.stop()
             self.game_board_additional_elements[1].configure(
                 text="It's a draw!!!",
                 fg=TEXT_COLOR
             )
         else:
-            # Threads are used so that
-            # 1. Progress can be updated in real time with calculations
-            # 2. Interface doesn't stop responding from interactions
-            Thread(target=self.take_computer_turn).start()
-            Thread(target=self.refresh_progress).start()
-            #self.refresh_progress()
-
+            # The turn is worked out on the worker thread, so the interface
+            # keeps responding, and progress is shown as it goes
+            self.take_computer_turn()
 
     def start_game(self):
-        self.board = Board(self.num_to_win, self.num_of_rows, self.num_of_cols)
+        engine = None
+        if self.num_of_rows*self.num_of_cols > MAX_BOARD_SPACES:
+            engine = LARGE_BOARD_ENGINE
+        self.board = Board(self.num_to_win, self.num_of_rows, self.num_of_cols, engine=engine)
+        self.computer_thinking = False
 
         self.take_computer_turn()
-        self.game_board_additional_elements[1].configure(
-            text=f"Your turn!",
-            fg=TEXT_COLOR
-        )
 
 
+# Read the command line
+parser = argparse.ArgumentParser(description="Plays Dynamic Tic-Tac-Toe against the computer.")
+parser.add_argument("--max-spaces", type=int, default=MAX_HEURISTIC_BOARD_SPACES,
+                    help=f"largest board (in spaces) that can be picked, boards over {MAX_BOARD_SPACES} "
+                         f"spaces are played with the {LARGE_BOARD_ENGINE} engine")
+parser.add_argument("--renderer", choices=RENDERERS, default="auto",
+                    help=f"draw the board as buttons or on a canvas (auto: a canvas past {MAX_BOARD_SPACES} spaces)")
+args = parser.parse_args()
+
 # Set up window
 window = tk.Tk()
-interface = Interface(window, "450x255", "Dynamic Tic-Tac-Toe", BACKGROUND_COLOR)
+interface = Interface(window, "450x255", "Dynamic Tic-Tac-Toe", BACKGROUND_COLOR,
+                      max(MIN_BOARD_SIDE*MIN_BOARD_SIDE, args.max_spaces), args.renderer)
 interface.draw_main_menu()
 
 # Run window
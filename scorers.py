@@ -0,0 +1,35 @@
+
+'''
+The ways a simulated board's fills can be tallied. Every scorer takes
+(geometry, x_bits, o_bits, empty_indices, start=0, stop=None) and returns the
+same (computer_wins, player_wins) tally as fill_space.tally_fills().
+'''
+
+from functools import partial
+
+from counting_scoring import tally_fills_counting
+from fill_space import tally_fills
+from numpy_scoring import tally_fills_numpy
+
+SCORERS = {
+    'enumerate': tally_fills,
+    'numpy': tally_fills_numpy,
+    'counting': tally_fills_counting
+}
+
+#Scorers that tally a whole simulated board at once, and only enumerate when
+#given a slice of its fills. Their fill spaces aren't split up into shards
+#or cancellation checks.
+WHOLE_BOARD_SCORERS = {'counting'}
+
+def get_scorer(name, chunk_size=None):
+    '''
+    Returns the tally function for the scorer with the given name. chunk_size
+    is passed on to the numpy scorer, to bound how many fills it holds in
+    memory at once.
+    '''
+    if name not in SCORERS:
+        raise ValueError(f'Unknown scorer {name!r}, expected one of {", ".join(SCORERS)}')
+    if name == 'numpy' and chunk_size != None:
+        return partial(tally_fills_numpy, chunk_size=chunk_size)
+    return SCORERS[name]
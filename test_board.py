@@ -0,0 +1,26 @@
+
+'''
+Checks Board's own choices of the computer's turn. Run with:
+    python -m pytest test_board.py
+'''
+
+from dynamic_tictactoe import Board
+
+def make_board(x_bits=0, o_bits=0):
+    board = Board(3, 3, 3, transposition_table=None, opening_book=None)
+    board.show_progress = False
+    board.set_position(x_bits, o_bits)
+    return board
+
+def test_first_turn_takes_the_centre():
+    board = make_board()
+    assert board.check_if_first_turn()
+    assert board.find_optimal_computer_turn() == [1, 1]
+
+def test_playing_second_is_not_a_first_turn():
+    #The player has taken the centre, so the computer can't.
+    board = make_board(x_bits=1 << 4)
+    assert not board.check_if_first_turn()
+    turn = board.find_optimal_computer_turn()
+    assert turn != [1, 1]
+    assert board.game_board[turn[0]][turn[1]] == '_'
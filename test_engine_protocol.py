@@ -0,0 +1,31 @@
+
+'''
+Checks what the engine protocol reports about its searches. Run with:
+    python -m pytest test_engine_protocol.py
+'''
+
+import io
+
+from engine_protocol import EngineProtocol
+from negamax_engine import NegamaxEngine
+
+def run_commands(*commands, engine=None):
+    output = io.StringIO()
+    protocol = EngineProtocol(output=output)
+    protocol.engine = engine
+    protocol.run(list(commands) + ['isready', 'quit'])
+    return output.getvalue().splitlines()
+
+def test_search_stopped_by_engine_time_limit_is_not_complete():
+    lines = run_commands('newgame 4 4 4', 'go', engine=NegamaxEngine(time_limit=0.1))
+    assert lines[0].startswith('info ') and ' complete false ' in lines[0]
+    assert lines[1].startswith('bestmove ')
+
+def test_search_to_the_end_is_complete():
+    lines = run_commands('setoption name engine value negamax', 'newgame 3 3 3', 'go')
+    assert ' complete true ' in lines[0]
+
+def test_board_size_is_limited():
+    lines = run_commands('newgame 50 50 5', 'go')
+    assert lines[0] == 'error boards are limited to 20 spaces without an engine'
+    assert lines[1] == 'error no game, send newgame first'
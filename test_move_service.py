@@ -0,0 +1,27 @@
+
+'''
+Checks the move service's sharing of identical searches. Run with:
+    python -m pytest test_move_service.py
+'''
+
+import asyncio
+import json
+
+from move_service import MoveService
+
+def test_identical_queries_share_one_search():
+    async def run():
+        service = MoveService(workers=1, max_pending=2)
+        try:
+            line = json.dumps({'op': 'query', 'rows': 4, 'cols': 4, 'k': 4, 'engine': 'negamax',
+                               'cells': 'x______________o', 'deadline_ms': 300})
+            replies = await asyncio.gather(*(service.handle_line(line) for i in range(8)))
+            return replies, service.counters
+        finally:
+            service.close()
+    replies, counters = asyncio.run(run())
+    assert all(reply['ok'] for reply in replies), replies
+    assert len({(reply['row'], reply['col']) for reply in replies}) == 1
+    assert counters['searches'] == 1
+    assert counters['coalesced'] == 7
+    assert counters['rejected'] == 0
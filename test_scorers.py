@@ -0,0 +1,55 @@
+
+'''
+Checks that every scorer gives the same tallies as enumerating the fills, on
+random positions of small boards. Run with:
+    python -m pytest test_scorers.py
+'''
+
+import random
+
+import pytest
+
+from counting_scoring import tally_fills_counting
+from fill_space import count_fills, tally_fills
+from geometry import get_geometry
+from numpy_scoring import np, tally_fills_numpy
+
+def random_positions(num_of_positions, seed=2024):
+    '''
+    Yields (geometry, x_bits, o_bits, empty_indices) for random boards of up
+    to 5x5, about a fifth of each competitor's marks.
+    '''
+    rng = random.Random(seed)
+    for i in range(num_of_positions):
+        geometry = get_geometry(rng.randint(1, 5), rng.randint(1, 5), rng.randint(1, 5))
+        x_bits = o_bits = 0
+        for index in range(geometry.num_of_cells):
+            roll = rng.random()
+            if roll < 0.2:
+                x_bits |= 1 << index
+            elif roll < 0.4:
+                o_bits |= 1 << index
+        empty_indices = [index for index in range(geometry.num_of_cells) if not (x_bits | o_bits) >> index & 1]
+        yield geometry, x_bits, o_bits, empty_indices
+
+def test_counting_matches_enumeration():
+    for geometry, x_bits, o_bits, empty_indices in random_positions(500):
+        assert tally_fills_counting(geometry, x_bits, o_bits, empty_indices) \
+            == tally_fills(geometry, x_bits, o_bits, empty_indices)
+
+def test_counting_slices_match_enumeration():
+    geometry = get_geometry(3, 4, 3)
+    empty_indices = list(range(1, 12))
+    num_of_fills = count_fills(len(empty_indices))
+    for start, stop in ((0, num_of_fills//2), (num_of_fills//2, None)):
+        assert tally_fills_counting(geometry, 1, 0, empty_indices, start, stop) \
+            == tally_fills(geometry, 1, 0, empty_indices, start, stop)
+
+@pytest.mark.skipif(np == None, reason='NumPy is not installed')
+def test_numpy_matches_enumeration():
+    for geometry, x_bits, o_bits, empty_indices in random_positions(200):
+        num_of_fills = count_fills(len(empty_indices))
+        assert tally_fills_numpy(geometry, x_bits, o_bits, empty_indices, chunk_size=64) \
+            == tally_fills(geometry, x_bits, o_bits, empty_indices)
+        assert tally_fills_numpy(geometry, x_bits, o_bits, empty_indices, num_of_fills//3, num_of_fills//2) \
+            == tally_fills(geometry, x_bits, o_bits, empty_indices, num_of_fills//3, num_of_fills//2)
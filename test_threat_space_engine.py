@@ -0,0 +1,25 @@
+
+'''
+Checks the threat-space engine's choice of turns. Run with:
+    python -m pytest test_threat_space_engine.py
+'''
+
+from dynamic_tictactoe import Board
+from threat_space_engine import ThreatSpaceEngine
+
+def test_opens_in_the_centre():
+    for num_of_rows, num_of_cols, required_in_a_row, centre in ((15, 15, 5, [7, 7]), (10, 10, 4, [4, 4])):
+        board = Board(required_in_a_row, num_of_rows, num_of_cols, engine=ThreatSpaceEngine(time_limit=0.1))
+        board.show_progress = False
+        assert board.find_optimal_computer_turn() == centre
+
+def test_equal_turns_are_ordered_by_distance_to_the_centre():
+    engine = ThreatSpaceEngine(max_moves=None)
+    board = Board(5, 15, 15, engine=engine)
+    engine.geometry = board.geometry
+    #Each pair is alike next to a mark at [5, 5] but for its distance to the
+    #centre at [7, 7].
+    their_bits = 1 << (5*15 + 5)
+    moves = engine.order_moves(0, their_bits, board.geometry.full_bits & ~their_bits, None)
+    for nearer, further in (((6, 6), (4, 4)), ((5, 6), (5, 4)), ((6, 5), (4, 5))):
+        assert moves.index(nearer[0]*15 + nearer[1]) < moves.index(further[0]*15 + further[1])
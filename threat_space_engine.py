@@ -0,0 +1,222 @@
+
+'''
+Heuristic engine for boards too large for the permutation scoring or an exact
+search, such as 10x10 or 15x15 with 4 or 5 in a row. It's the negamax search of
+negamax_engine.py with a threat-space evaluation at its depth limit, and with
+only the most promising turns near the marks already played searched at each
+node, so that it can look a few turns ahead in its time budget.
+
+The evaluation, threat_evaluation(), goes over the geometry's win lines once:
+  - a line holding only one competitor's marks is worth more the more marks it
+    holds, and more again the more of the coordinates just past its ends are
+    empty (open lines are worth more than half-open ones, which are worth more
+    than closed ones);
+  - an immediate threat (a line one mark short) of the competitor to move is a
+    win next turn, and two immediate threats of the other competitor can't
+    both be blocked;
+  - a double threat (a turn making two immediate threats at once) of the
+    competitor to move wins, if they don't have to block first.
+'''
+
+from negamax_engine import LINE_WEIGHTS, WIN_THRESHOLD, NegamaxEngine
+
+#Evaluations for positions the threats decide. They stay below WIN_THRESHOLD,
+#so the search still treats them as evaluations rather than proven results.
+THREAT_SCORE = WIN_THRESHOLD//2
+DOUBLE_THREAT_SCORE = WIN_THRESHOLD//4
+#Largest evaluation from the lines alone.
+MAX_LINE_SCORE = WIN_THRESHOLD//8
+#Turns searched at each node, and how far (in rows and columns) a turn can be
+#from the nearest mark to be searched.
+DEFAULT_MAX_MOVES = 12
+DEFAULT_NEIGHBOURHOOD = 2
+#Nodes searched between checks of the clock. Nodes cost up to about half a
+#millisecond on a 15x15 board, so this keeps a search within a few tens of
+#milliseconds of its budget.
+CLOCK_CHECK_INTERVAL = 32
+
+_threat_tables = {}
+
+class ThreatTables:
+    def __init__(self, geometry):
+        #For every win line, (mask, ends_mask), where ends_mask has the
+        #coordinates just before and after the line, those that are on the
+        #board.
+        self.lines = [(mask, self.find_ends_mask(geometry, line))
+                      for line, mask in zip(geometry.lines, geometry.line_masks)]
+        #For every flat index, its squared distance from the centre of the
+        #board, doubled so it stays a whole number.
+        self.centre_distances = [(2*(index//geometry.num_of_cols) - geometry.num_of_rows + 1)**2
+                                 + (2*(index%geometry.num_of_cols) - geometry.num_of_cols + 1)**2
+                                 for index in range(geometry.num_of_cells)]
+        #Neighbourhood -> for every flat index, the bitmask of coordinates
+        #within that many rows and columns of it. Built as they're asked for.
+        self.neighbour_masks = {}
+        self.geometry = geometry
+
+    def find_ends_mask(self, geometry, line):
+        if len(line) < 2:
+            return 0
+        num_of_cols = geometry.num_of_cols
+        row_step = line[1]//num_of_cols - line[0]//num_of_cols
+        col_step = line[1]%num_of_cols - line[0]%num_of_cols
+        ends_mask = 0
+        for index, step in ((line[0], -1), (line[-1], 1)):
+            row = index//num_of_cols + step*row_step
+            col = index%num_of_cols + step*col_step
+            if 0 <= row < geometry.num_of_rows and 0 <= col < num_of_cols:
+                ends_mask |= 1 << (row*num_of_cols + col)
+        return ends_mask
+
+    def get_neighbour_masks(self, neighbourhood):
+        masks = self.neighbour_masks.get(neighbourhood)
+        if masks == None:
+            geometry = self.geometry
+            masks = []
+            for index in range(geometry.num_of_cells):
+                row, col = index//geometry.num_of_cols, index%geometry.num_of_cols
+                mask = 0
+                for other_row in range(max(0, row - neighbourhood), min(geometry.num_of_rows, row + neighbourhood + 1)):
+                    for other_col in range(max(0, col - neighbourhood), min(geometry.num_of_cols, col + neighbourhood + 1)):
+                        mask |= 1 << (other_row*geometry.num_of_cols + other_col)
+                masks.append(mask)
+            self.neighbour_masks[neighbourhood] = masks
+        return masks
+
+def get_threat_tables(geometry):
+    '''
+    Returns the ThreatTables of the geometry, built once per geometry.
+    '''
+    key = (geometry.num_of_rows, geometry.num_of_cols, geometry.required_in_a_row)
+    tables = _threat_tables.get(key)
+    if tables == None:
+        tables = ThreatTables(geometry)
+        _threat_tables[key] = tables
+    return tables
+
+def find_double_threats(threat_pairs):
+    '''
+    Returns the bitmask of coordinates where a mark makes two immediate
+    threats at once, given (a, b) flat index pairs of the empty coordinates of
+    lines two marks short: a mark at a threatens b, and the other way around.
+    '''
+    threatened = {}
+    double_threat_bits = 0
+    for a, b in threat_pairs:
+        for index, threat_index in ((a, b), (b, a)):
+            previous = threatened.setdefault(index, threat_index)
+            if previous != threat_index:
+                double_threat_bits |= 1 << index
+    return double_threat_bits
+
+def threat_evaluation(geometry, my_bits, their_bits):
+    '''
+    Scores a position for the competitor to move, see the top of this file.
+    '''
+    required_in_a_row = geometry.required_in_a_row
+    empty_bits = geometry.full_bits & ~(my_bits | their_bits)
+    taken_bits = my_bits | their_bits
+    num_of_weights = len(LINE_WEIGHTS)
+    score = 0
+    my_threat_bits = 0
+    their_threat_bits = 0
+    my_threat_pairs = []
+    their_threat_pairs = []
+    for mask, ends_mask in get_threat_tables(geometry).lines:
+        if not mask & taken_bits:
+            continue
+        mine = my_bits & mask
+        theirs = their_bits & mask
+        if mine and theirs:
+            continue
+        marks = mine or theirs
+        num_of_marks = bin(marks).count('1')
+        line_score = LINE_WEIGHTS[min(num_of_marks, num_of_weights - 1)]*(1 + bin(ends_mask & empty_bits).count('1'))
+        gaps = mask & ~marks
+        if mine:
+            score += line_score
+            if num_of_marks == required_in_a_row - 1:
+                my_threat_bits |= gaps
+            elif num_of_marks == required_in_a_row - 2:
+                my_threat_pairs.append((gaps.bit_length() - 1, (gaps & -gaps).bit_length() - 1))
+        else:
+            score -= line_score
+            if num_of_marks == required_in_a_row - 1:
+                their_threat_bits |= gaps
+            elif num_of_marks == required_in_a_row - 2:
+                their_threat_pairs.append((gaps.bit_length() - 1, (gaps & -gaps).bit_length() - 1))
+    #The competitor to move completes a line next turn.
+    if my_threat_bits:
+        return THREAT_SCORE
+    #Only one of the other competitor's threats can be blocked.
+    if bin(their_threat_bits).count('1') >= 2:
+        return -THREAT_SCORE
+    if not their_threat_bits and find_double_threats(my_threat_pairs):
+        return DOUBLE_THREAT_SCORE
+    #The other competitor's double threats have to be blocked before they're
+    #made, which costs a turn.
+    num_of_their_double_threats = bin(find_double_threats(their_threat_pairs)).count('1')
+    if num_of_their_double_threats >= 2 or (num_of_their_double_threats and their_threat_bits):
+        score -= DOUBLE_THREAT_SCORE//2
+    return max(-MAX_LINE_SCORE, min(MAX_LINE_SCORE, score))
+
+class ThreatSpaceEngine(NegamaxEngine):
+    def __init__(self, max_depth=None, time_limit=1.0, evaluate=threat_evaluation,
+                 max_table_entries=1000000, max_moves=DEFAULT_MAX_MOVES,
+                 neighbourhood=DEFAULT_NEIGHBOURHOOD):
+        NegamaxEngine.__init__(self, max_depth, time_limit, evaluate, max_table_entries)
+        #Turns searched at each node (None for all of them), and how far a
+        #turn can be from the nearest mark.
+        self.max_moves = max_moves
+        self.neighbourhood = neighbourhood
+        self.clock_check_interval = CLOCK_CHECK_INTERVAL
+
+    def order_moves(self, my_bits, their_bits, empty_bits, table_index):
+        '''
+        Returns the empty flat indices near the marks already played in the
+        order they should be searched, at most max_moves of them: the table's
+        best turn first, then turns that win, then turns that block the other
+        competitor's win, then the rest by how much they add to or take away
+        from lines that are still open, then by how many win lines pass
+        through them, then by how near they are to the centre. On an empty
+        board, only the centre is worth searching.
+        '''
+        geometry = self.geometry
+        threat_tables = get_threat_tables(geometry)
+        centre_distances = threat_tables.centre_distances
+        taken_bits = my_bits | their_bits
+        if not taken_bits:
+            return [min(range(geometry.num_of_cells), key=lambda index: centre_distances[index])]
+        neighbour_masks = threat_tables.get_neighbour_masks(self.neighbourhood)
+        near_bits = 0
+        bits = taken_bits
+        while bits:
+            lowest_bit = bits & -bits
+            near_bits |= neighbour_masks[lowest_bit.bit_length() - 1]
+            bits ^= lowest_bit
+        empty_bits &= near_bits
+        required_in_a_row = geometry.required_in_a_row
+        num_of_weights = len(LINE_WEIGHTS)
+        scored_moves = []
+        bits = empty_bits
+        while bits:
+            lowest_bit = bits & -bits
+            index = lowest_bit.bit_length() - 1
+            bits ^= lowest_bit
+            priority = 4 if index == table_index else 0
+            activity = 0
+            for mask in geometry.cell_line_masks[index]:
+                mine = my_bits & mask
+                theirs = their_bits & mask
+                if mine and theirs:
+                    continue
+                num_of_marks = bin(mine or theirs).count('1')
+                if num_of_marks == required_in_a_row - 1:
+                    priority = max(priority, 3 if mine else 2)
+                activity += LINE_WEIGHTS[min(num_of_marks, num_of_weights - 1)]
+            scored_moves.append((priority, activity, len(geometry.cell_lines[index]), -centre_distances[index],
+                                 -index, index))
+        scored_moves.sort(reverse=True)
+        if self.max_moves != None:
+            scored_moves = scored_moves[:self.max_moves]
+        return [move[5] for move in scored_moves]
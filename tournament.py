@@ -0,0 +1,240 @@
+
+'''
+Headless self-play tournaments. Plays games between computer players (the
+permutation scoring, engines, or different configurations of them) and
+simple scripted players standing in for the human, on worker processes, over a
+set of geometries. Reports win/draw/loss rates for every pairing, per-move
+latency of every player and games per second, to check that making a player
+faster hasn't made it weaker, and to load test the players.
+
+Players are given as name[:option=value,...], for example:
+    permutation                   Board's own scoring (options go to Board)
+    permutation:scorer=numpy
+    negamax:time_limit=0.2        an engine from engines.py (options go to it)
+    mcts:time_limit_ms=100,playout_policy=light
+    random                        a uniformly random turn
+    scripted                      wins or blocks when it can, else random
+
+To play every pair of players 100 games on two geometries:
+    python tournament.py --players permutation negamax random --geometry 3x3x3 --geometry 4x4x4 --games 100
+Each pairing plays half of its games with each player going first.
+'''
+
+import argparse
+import ast
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmark import geometry_name, parse_geometry, summarise
+from dynamic_tictactoe import Board
+from engines import ENGINES
+
+DEFAULT_GAMES = 20
+DEFAULT_SEED = 2024
+
+def parse_player(spec):
+    '''
+    Parses a player spec, such as 'negamax:time_limit=0.2', into
+    (name, options).
+    '''
+    name, separator, option_text = spec.partition(':')
+    if name not in ('permutation', 'random', 'scripted') and name not in ENGINES:
+        raise ValueError(f'Unknown player {name!r}, expected permutation, random, scripted or one of {sorted(ENGINES)}')
+    options = {}
+    for option in option_text.split(',') if option_text else []:
+        key, separator, value = option.partition('=')
+        try:
+            options[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            options[key] = value
+    return name, options
+
+class RandomPlayer:
+    def __init__(self, rng):
+        self.rng = rng
+
+    def find_turn(self, board):
+        return self.rng.choice(board.generate_all_computer_options())
+
+class ScriptedPlayer(RandomPlayer):
+    def find_turn(self, board):
+        '''
+        Takes a win if there is one, else blocks the other side's win, else
+        plays at random.
+        '''
+        taken_bits = board.x_bits | board.o_bits
+        for competitor in ('o', 'x'):
+            indices = board.line_counts.winning_indices(competitor, taken_bits)
+            if indices:
+                return [indices[0]//board.num_of_cols, indices[0]%board.num_of_cols]
+        return RandomPlayer.find_turn(self, board)
+
+class BoardPlayer:
+    def find_turn(self, board):
+        return board.find_optimal_computer_turn()
+
+def make_player(spec, geometry, seed):
+    '''
+    Returns (player, board) for a player spec. Each player keeps its own board,
+    on which its own marks are the computer's ('o').
+    '''
+    name, options = parse_player(spec)
+    num_of_rows, num_of_cols, required_in_a_row = geometry
+    board_options = {}
+    if name == 'permutation':
+        board_options = options
+    elif name in ENGINES:
+        board_options = {'engine': ENGINES[name](**options)}
+    board = Board(required_in_a_row, num_of_rows, num_of_cols, **board_options)
+    board.show_progress = False
+    if name == 'random':
+        return RandomPlayer(random.Random(seed)), board
+    if name == 'scripted':
+        return ScriptedPlayer(random.Random(seed)), board
+    return BoardPlayer(), board
+
+def play_game(geometry, first_spec, second_spec, seed):
+    '''
+    Plays one game. Returns its result: the winner ('first', 'second' or None
+    for a draw), the number of turns, each side's turn latencies, and whether
+    the loser lost by playing an illegal turn.
+    '''
+    players = {}
+    boards = {}
+    players['first'], boards['first'] = make_player(first_spec, geometry, seed)
+    players['second'], boards['second'] = make_player(second_spec, geometry, seed + 1)
+    latencies = {'first': [], 'second': []}
+    side, other_side = 'first', 'second'
+    winner = None
+    illegal = False
+    num_of_turns = 0
+    while True:
+        board = boards[side]
+        start_time = time.perf_counter()
+        turn = players[side].find_turn(board)
+        latencies[side].append(time.perf_counter() - start_time)
+        num_of_turns += 1
+        row, col = turn
+        if not (0 <= row < board.num_of_rows and 0 <= col < board.num_of_cols) \
+                or (board.x_bits | board.o_bits) >> (row*board.num_of_cols + col) & 1:
+            winner, illegal = other_side, True
+            break
+        board.apply_computer_turn(turn)
+        boards[other_side].apply_player_turn(row, col)
+        if board.check_if_winner_exists(competitor='computer'):
+            winner = side
+            break
+        if board.check_if_full_board():
+            break
+        side, other_side = other_side, side
+    return {
+        'geometry': list(geometry),
+        'first': first_spec,
+        'second': second_spec,
+        'winner': winner,
+        'illegal': illegal,
+        'turns': num_of_turns,
+        'latencies': latencies
+    }
+
+def schedule_games(players, geometries, num_of_games, seed):
+    '''
+    Returns (geometry, first_spec, second_spec, seed) for every game: each pair
+    of players plays num_of_games on each geometry, half going first each.
+    '''
+    games = []
+    for geometry in geometries:
+        for spec_a, spec_b in itertools.combinations(players, 2):
+            for game in range(num_of_games):
+                first_spec, second_spec = (spec_a, spec_b) if game%2 == 0 else (spec_b, spec_a)
+                games.append((geometry, first_spec, second_spec, seed + 2*len(games)))
+    return games
+
+def summarise_games(results):
+    '''
+    Returns win/draw/loss counts for every pairing on every geometry (from the
+    point of view of the pairing's first-named player) and each player's turn
+    latencies.
+    '''
+    pairings = {}
+    latencies = {}
+    for result in results:
+        spec_a, spec_b = sorted((result['first'], result['second']))
+        key = f'{geometry_name(*result["geometry"])} {spec_a} vs {spec_b}'
+        pairing = pairings.setdefault(key, {'player': spec_a, 'opponent': spec_b, 'games': 0, 'wins': 0,
+                                            'draws': 0, 'losses': 0, 'illegal_turns': 0})
+        pairing['games'] += 1
+        if result['winner'] == None:
+            pairing['draws'] += 1
+        elif result[result['winner']] == spec_a:
+            pairing['wins'] += 1
+        else:
+            pairing['losses'] += 1
+        if result['illegal']:
+            pairing['illegal_turns'] += 1
+        for side in ('first', 'second'):
+            latencies.setdefault(result[side], []).extend(result['latencies'][side])
+    for pairing in pairings.values():
+        pairing['win_rate'] = pairing['wins']/pairing['games']
+        pairing['draw_rate'] = pairing['draws']/pairing['games']
+        pairing['loss_rate'] = pairing['losses']/pairing['games']
+    return pairings, {spec: summarise(seconds) for spec, seconds in latencies.items() if seconds}
+
+def run_tournament(players, geometries, num_of_games=DEFAULT_GAMES, processes=None, seed=DEFAULT_SEED):
+    '''
+    Plays every scheduled game on a pool of processes (one per core if
+    processes is None). Returns the report.
+    '''
+    for spec in players:
+        parse_player(spec)
+    games = schedule_games(players, geometries, num_of_games, seed)
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count() or 1) as pool:
+        futures = [pool.submit(play_game, *game) for game in games]
+        results = [future.result() for future in futures]
+    seconds = time.perf_counter() - start_time
+    pairings, latencies = summarise_games(results)
+    return {
+        'games': len(results),
+        'seconds': seconds,
+        'games_per_second': len(results)/seconds if seconds > 0 else 0.0,
+        'moves_per_second': sum(result['turns'] for result in results)/seconds if seconds > 0 else 0.0,
+        'pairings': pairings,
+        'latencies': latencies
+    }
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Plays computer players against each other without a display.')
+    parser.add_argument('--players', nargs='+', required=True, help='player specs, at least two')
+    parser.add_argument('--geometry', type=parse_geometry, action='append',
+                        help='geometry to play, as ROWSxCOLSxTO_WIN (default: 3x3x3)')
+    parser.add_argument('--games', type=int, default=DEFAULT_GAMES, help='games per pairing per geometry')
+    parser.add_argument('--processes', type=int, default=None, help='processes to play on (default: one per core)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='seed of the random players')
+    parser.add_argument('--output', help='file to write the report to, as JSON')
+    args = parser.parse_args(arguments)
+    if len(args.players) < 2:
+        parser.error('at least two players are needed')
+    try:
+        report = run_tournament(args.players, args.geometry or [(3, 3, 3)], args.games, args.processes, args.seed)
+    except ValueError as error:
+        parser.error(str(error))
+    for name, pairing in report['pairings'].items():
+        print(f'{name}: {pairing["wins"]} won, {pairing["draws"]} drawn, {pairing["losses"]} lost'
+              + (f' ({pairing["illegal_turns"]} illegal turns)' if pairing['illegal_turns'] else ''))
+    for spec, latency in report['latencies'].items():
+        print(f'{spec}: turn p50 {latency["p50"]*1000:.2f} ms, p99 {latency["p99"]*1000:.2f} ms, '
+              f'max {latency["max"]*1000:.2f} ms')
+    print(f'{report["games"]} games in {report["seconds"]:.1f} s ({report["games_per_second"]:.1f} games/s)')
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
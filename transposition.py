@@ -0,0 +1,78 @@
+
+'''
+Transposition table for scores of simulated boards. A simulated board's score
+only depends on the board up to rotation/reflection, so scores are stored under
+the board's canonical form (see Geometry.canonical_bits()), and any symmetric
+version of a board already scored is a hit. The table has a bounded size and
+evicts the least recently used entries once it's full.
+'''
+
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 200000
+
+class TranspositionTable:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def make_key(self, geometry, x_bits, o_bits):
+        '''
+        Returns the key for a board: its geometry and canonical form.
+        '''
+        return (geometry.num_of_rows, geometry.num_of_cols, geometry.required_in_a_row) \
+            + geometry.canonical_bits(x_bits, o_bits)
+
+    def lookup(self, geometry, x_bits, o_bits):
+        '''
+        Returns the score stored for the board (or any of its symmetries), or
+        None if there isn't one.
+        '''
+        key = self.make_key(geometry, x_bits, o_bits)
+        score = self.entries.get(key)
+        if score == None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return score
+
+    def store(self, geometry, x_bits, o_bits, score):
+        '''
+        Stores the score for the board, evicting the least recently used
+        entry if the table is full.
+        '''
+        key = self.make_key(geometry, x_bits, o_bits)
+        self.entries[key] = score
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        '''
+        Removes every entry and resets the hit/miss counters.
+        '''
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        '''
+        Returns a dictionary of the table's size and hit/miss counters.
+        '''
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits/lookups if lookups else 0.0
+        }
+
+#Shared by every Board, so positions are reused across turns and games.
+shared_transposition_table = TranspositionTable()